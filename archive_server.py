@@ -0,0 +1,316 @@
+"""
+A local stand-in for the chess.com archive server, and a check of
+fetch_games against it.
+
+ArchiveServer serves the yYYYYmMM.json files in a fixture directory at
+the urls fetch_games asks for (<player>/games/<YYYY>/<MM> under
+/pub/player).  Every archive is sent with an ETag (its sha256) and a
+Last-Modified header (its modification time), and a request whose
+If-None-Match matches is answered with 304 Not Modified.  Months
+without a file are answered with 404, and a url can be made to fail
+with 503 a given number of times before it is served.  Every request is
+logged with the status it got.
+
+run_check writes a few synthetic archives, starts the server and runs
+fetch_archives against it several times, checking the outcome of every
+month, the requests made, the files written and fetch_state.json.
+
+Run with:
+    python -m chess_career.archive_server [fixture directory]
+The fixture directory is served as it is if given.  Otherwise the
+check is run in a temporary directory.
+"""
+import contextlib
+import email.utils
+import hashlib
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+from chess_career.fetch_games import (
+    fetch_archives,
+    month_file_name,
+    read_fetch_state,
+    CHANGED,
+    F_ETAG,
+    F_MODIFIED,
+    FETCH_STATE,
+    MISSING,
+    UNCHANGED
+)
+from chess_career.synthetic import write_career, SYNTH_PLAYER
+URL_PREFIX = "/pub/player/"
+CHECK_GAMES = 60
+CHECK_PER_MONTH = 20
+CHECK_MONTHS = [(2015, 1), (2015, 2), (2015, 3), (2015, 4)]
+FLAKY_MONTH = (2015, 2)
+EDITED_MONTH = (2015, 3)
+
+
+class ArchiveHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answer GET requests for monthly archives from the files in the
+    server's fixture directory.
+    """
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, headers=None, body=b""):
+        """
+        Send a response and log it
+        """
+        self.server.log.append((self.path, status))
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """
+        Serve one month (see ArchiveServer)
+        """
+        parts = self.path[len(URL_PREFIX):].split("/")
+        if (not self.path.startswith(URL_PREFIX) or len(parts) != 4 or
+                parts[1] != "games"):
+            self.reply(404)
+            return
+        with self.server.lock:
+            failures = self.server.failures.get(self.path, 0)
+            if failures:
+                self.server.failures[self.path] = failures - 1
+        if failures:
+            self.reply(503)
+            return
+        afile = os.path.join(self.server.fixture_dir,
+                             month_file_name(int(parts[2]), int(parts[3])))
+        try:
+            with open(afile, 'rb') as iofd:
+                body = iofd.read()
+        except OSError:
+            self.reply(404)
+            return
+        headers = {
+            "ETag": '"{}"'.format(hashlib.sha256(body).hexdigest()),
+            "Last-Modified": email.utils.formatdate(
+                os.stat(afile).st_mtime, usegmt=True)
+        }
+        if self.headers.get("If-None-Match") == headers["ETag"]:
+            self.reply(304, headers)
+            return
+        headers["Content-Type"] = "application/json"
+        self.reply(200, headers, body)
+
+
+class ArchiveServer(http.server.ThreadingHTTPServer):
+    """
+    HTTP server on a free local port serving the archives in
+    fixture_dir.
+
+    failures is a dictionary indexed by url path of the number of times
+    that path is answered with 503 before it is served.  log is the
+    list of (url path, status) tuples of the requests answered.
+    """
+    daemon_threads = True
+
+    def __init__(self, fixture_dir):
+        super().__init__(("127.0.0.1", 0), ArchiveHandler)
+        self.fixture_dir = fixture_dir
+        self.failures = {}
+        self.log = []
+        self.lock = threading.Lock()
+
+    def base_url(self):
+        """
+        Return the url to use as the archiveurl setting
+        """
+        return "http://127.0.0.1:{}{}".format(self.server_address[1],
+                                              URL_PREFIX.rstrip("/"))
+
+    def month_path(self, player, year, month):
+        """
+        Return the url path requested for a month of a player's games
+        """
+        return "{}{}/games/{}/{:02d}".format(URL_PREFIX, player.lower(),
+                                             year, month)
+
+
+@contextlib.contextmanager
+def serve(fixture_dir):
+    """
+    Context manager that runs an ArchiveServer in a background thread
+    and yields it.
+    """
+    server = ArchiveServer(fixture_dir)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def expect(condition, message):
+    """
+    Raise RuntimeError with message if condition is not true
+    """
+    if not condition:
+        raise RuntimeError("archive check failed: " + message)
+
+
+def file_bytes(file_name):
+    """
+    Return the contents of a file
+    """
+    with open(file_name, 'rb') as iofd:
+        return iofd.read()
+
+
+def fetch_and_log(server, todir):
+    """
+    Fetch CHECK_MONTHS from server into todir.
+
+    Returns: tuple of the outcomes (see fetch_archives) and the statuses
+    of the requests made, indexed by file name.
+    """
+    del server.log[:]
+    outcomes = fetch_archives(SYNTH_PLAYER, CHECK_MONTHS, todir,
+                              server.base_url(), backoff=0.01)
+    statuses = {}
+    for year, month in CHECK_MONTHS:
+        path = server.month_path(SYNTH_PLAYER, year, month)
+        statuses[month_file_name(year, month)] = [
+            status for lpath, status in server.log if lpath == path]
+    return outcomes, statuses
+
+
+def expect_fetched(todir, fixture_dir, names):
+    """
+    Check that the files in names were written to todir with the
+    fixture contents, that fetch_state.json holds the validators of
+    those files only, and that no temporary file was left behind.
+    """
+    state = read_fetch_state(todir)
+    expect(sorted(state) == sorted(names),
+           "fetch state holds {}".format(sorted(state)))
+    for name in names:
+        body = file_bytes(os.path.join(fixture_dir, name))
+        expect(file_bytes(os.path.join(todir, name)) == body,
+               "{} differs from the fixture".format(name))
+        etag = '"{}"'.format(hashlib.sha256(body).hexdigest())
+        expect(state[name].get(F_ETAG) == etag,
+               "{} has etag {}".format(name, state[name].get(F_ETAG)))
+        expect(F_MODIFIED in state[name],
+               "{} has no Last-Modified".format(name))
+    leftovers = [name for name in os.listdir(todir) if ".tmp" in name]
+    expect(not leftovers, "temporary files left: {}".format(leftovers))
+
+
+def run_check(root):
+    """
+    Check fetch_games against an ArchiveServer.  Fixture archives are
+    written to root/fixtures and fetched into root/fetched.
+
+    1. A first run fetches every month (200), retries the month that
+       fails once with 503, and finds that the last month is missing
+       (404).
+    2. A second run gets 304 for every month and rewrites nothing.
+    3. After a fixture month is edited, only that month is fetched.
+    4. With the fetch state removed, every month is sent again (200),
+       but files whose contents are the same are not rewritten.
+
+    Returns: list of the names of the steps checked.  Raises
+    RuntimeError on the first thing that is not as expected.
+    """
+    fixture_dir = os.path.join(root, "fixtures")
+    todir = os.path.join(root, "fetched")
+    write_career(fixture_dir, CHECK_GAMES, per_month=CHECK_PER_MONTH)
+    names = [month_file_name(year, month) for year, month in CHECK_MONTHS]
+    present = names[:-1]
+    missing = names[-1]
+    flaky = month_file_name(*FLAKY_MONTH)
+    edited = month_file_name(*EDITED_MONTH)
+    steps = []
+    with serve(fixture_dir) as server:
+        server.failures[server.month_path(SYNTH_PLAYER, *FLAKY_MONTH)] = 1
+        outcomes, statuses = fetch_and_log(server, todir)
+        for name in present:
+            expect(outcomes[name] == CHANGED,
+                   "first run: {} {}".format(name, outcomes[name]))
+            expected = [503, 200] if name == flaky else [200]
+            expect(statuses[name] == expected,
+                   "first run: {} got {}".format(name, statuses[name]))
+        expect(outcomes[missing] == MISSING and statuses[missing] == [404],
+               "first run: {} {} {}".format(missing, outcomes[missing],
+                                            statuses[missing]))
+        expect_fetched(todir, fixture_dir, present)
+        steps.append("200 on the first run, 503 then 200, 404")
+
+        mtimes = {name: os.stat(os.path.join(todir, name)).st_mtime_ns
+                  for name in present}
+        outcomes, statuses = fetch_and_log(server, todir)
+        for name in present:
+            expect(outcomes[name] == UNCHANGED and statuses[name] == [304],
+                   "second run: {} {} {}".format(name, outcomes[name],
+                                                 statuses[name]))
+        expect_fetched(todir, fixture_dir, present)
+        expect(all(os.stat(os.path.join(todir, name)).st_mtime_ns ==
+                   mtime for name, mtime in mtimes.items()),
+               "second run rewrote a file")
+        steps.append("304 on the second run")
+
+        efile = os.path.join(fixture_dir, edited)
+        with open(efile, 'r') as iofd:
+            archive = json.load(iofd)
+        archive["games"] = archive["games"][:CHECK_PER_MONTH // 2]
+        with open(efile, 'w') as iofd:
+            json.dump(archive, iofd)
+        outcomes, statuses = fetch_and_log(server, todir)
+        for name in present:
+            expected = (CHANGED, [200]) if name == edited else (UNCHANGED,
+                                                                [304])
+            expect((outcomes[name], statuses[name]) == expected,
+                   "edited run: {} {} {}".format(name, outcomes[name],
+                                                 statuses[name]))
+        expect_fetched(todir, fixture_dir, present)
+        steps.append("only the edited month fetched again")
+
+        os.remove(os.path.join(todir, FETCH_STATE))
+        mtimes = {name: os.stat(os.path.join(todir, name)).st_mtime_ns
+                  for name in present}
+        outcomes, statuses = fetch_and_log(server, todir)
+        for name in present:
+            expect(outcomes[name] == UNCHANGED and statuses[name] == [200],
+                   "no state run: {} {} {}".format(name, outcomes[name],
+                                                   statuses[name]))
+        expect(all(os.stat(os.path.join(todir, name)).st_mtime_ns ==
+                   mtime for name, mtime in mtimes.items()),
+               "an identical archive was rewritten")
+        expect_fetched(todir, fixture_dir, present)
+        steps.append("identical archives not rewritten")
+    return steps
+
+
+def main():
+    """
+    Serve a fixture directory until interrupted, or run the check.
+    """
+    if len(sys.argv) > 1:
+        with serve(sys.argv[1]) as server:
+            print("archiveurl = {}".format(server.base_url()))
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+        return
+    with tempfile.TemporaryDirectory() as root:
+        for step in run_check(root):
+            print("ok: {}".format(step))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Generate every report for a roster of players.
+
+The roster is an ini file with one section per player, named after the
+player's chess.com user name.  Each section must set datadir (the
+directory holding that player's monthly files) and may set fromdir
+(the directory the files are fetched into), sync and outdir (where the
+player's reports, positions and game pages go; BATCH_DIR/<player> if
+not set).  For example:
+
+    [ArtVark]
+    datadir = /chess/artvark/data
+    fromdir = /chess/artvark/grab
+
+Players are processed by a pool of worker processes.  The templates are
+read once and handed to every worker, and the parsed month caches live
+in each data directory, so players sharing a data directory share them.
+Every player's output is written under its own directory.
+
+Run with:
+    python -m chess_career.batch roster.ini [number of workers]
+"""
+import configparser
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+from chess_career.check_mate import collect_my_mates
+from chess_career.extract_game import extract_data, USER, WORKERS, O_ALL_DATA
+from chess_career.get_game_info import write_game_info
+from chess_career.io_module import (
+    read_template,
+    DATADIR,
+    DEFAULT,
+    FROMDIR,
+    GAMES_DIR,
+    SYNC,
+    TEMPLATE_CACHE
+)
+from chess_career.openings import generate_opening_reports, OPENING_GROUPS
+from chess_career.profiling import pool_map
+from chess_career.time_issues import generate_time_issue_report
+from chess_career.time_issues import generate_time_sweep_report
+BATCH_DIR = "batch_reports"
+OUTDIR = "outdir"
+TEMPLATE_DIR = "templates"
+OUTPUT_DIRS = ["reports", "positions", GAMES_DIR]
+PASSED_SETTINGS = [DATADIR, FROMDIR, SYNC]
+
+
+def load_templates(template_dir=TEMPLATE_DIR):
+    """
+    Read and split every template in template_dir.
+
+    Returns: dictionary in the form of io_module.TEMPLATE_CACHE
+    """
+    templates = {}
+    for tname in sorted(os.listdir(template_dir)):
+        if tname.endswith(".txt"):
+            templates[tname[:-len(".txt")]] = read_template(
+                os.path.join(template_dir, tname))
+    return templates
+
+
+def share_templates(templates):
+    """
+    Fill this process's template cache.  Used as the initializer of the
+    worker processes, so that no worker reads a template file.
+    """
+    TEMPLATE_CACHE.update(templates)
+
+
+def read_roster(roster_file):
+    """
+    Read a roster file.
+
+    Returns: list of (player, settings) tuples, where settings is a
+    dictionary of the values in the player's section, with relative
+    directories made absolute and outdir filled in.
+    """
+    conf_info = configparser.ConfigParser()
+    if not conf_info.read(roster_file):
+        raise FileNotFoundError(roster_file)
+    roster = []
+    for player in conf_info.sections():
+        settings = dict(conf_info[player])
+        if DATADIR not in settings:
+            raise ValueError("no {} set for {}".format(DATADIR, player))
+        settings.setdefault(OUTDIR, os.path.join(BATCH_DIR, player))
+        for key in (DATADIR, FROMDIR, OUTDIR):
+            if key in settings:
+                settings[key] = os.path.abspath(settings[key])
+        roster.append((player, settings))
+    return roster
+
+
+def write_player_ini(player, settings):
+    """
+    Write the chess.ini used for one player in the player's output
+    directory.  Reports for a player are generated in one process, so
+    the workers setting is 1.
+    """
+    conf_info = configparser.ConfigParser()
+    conf_info[DEFAULT][USER] = player
+    conf_info[DEFAULT][WORKERS] = "1"
+    for key in PASSED_SETTINGS:
+        if key in settings:
+            conf_info[DEFAULT][key] = settings[key]
+    with open(os.path.join(settings[OUTDIR], "chess.ini"), 'w') as iofd:
+        conf_info.write(iofd)
+
+
+def run_player(player, settings):
+    """
+    Generate all reports for one player: the opening reports, the time
+    issue and time sweep reports, the checkmate pages and the game
+    pages.  The data is extracted once and shared by every report.
+
+    Returns: tuple of the player and the number of games
+    """
+    for odir in OUTPUT_DIRS:
+        os.makedirs(os.path.join(settings[OUTDIR], odir), exist_ok=True)
+    write_player_ini(player, settings)
+    old_dir = os.getcwd()
+    os.chdir(settings[OUTDIR])
+    try:
+        data = extract_data()
+        generate_opening_reports(OPENING_GROUPS, data=data)
+        generate_time_issue_report(data=data)
+        generate_time_sweep_report(data=data)
+        collect_my_mates(workers=1, data=data)
+        write_game_info(data)
+    finally:
+        os.chdir(old_dir)
+    return player, len(data[O_ALL_DATA])
+
+
+def run_batch(roster_file, workers=1, template_dir=TEMPLATE_DIR):
+    """
+    Generate all reports for every player in a roster.
+
+    Args:
+        roster_file -- ini file describing the players (see above)
+        workers -- number of players processed at the same time
+        template_dir -- directory holding the templates
+
+    Returns: list of (player, number of games) tuples, in roster order
+    """
+    roster = read_roster(roster_file)
+    templates = load_templates(template_dir)
+    if workers > 1 and len(roster) > 1:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=share_templates,
+                                 initargs=(templates,)) as pool:
+            players, settings = zip(*roster)
+            return list(pool_map(pool, run_player, players, settings))
+    share_templates(templates)
+    return [run_player(player, settings) for player, settings in roster]
+
+
+if __name__ == "__main__":
+    NWORKERS = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    for name, ngames in run_batch(sys.argv[1], NWORKERS):
+        print("{}: {} games".format(name, ngames))
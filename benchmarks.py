@@ -0,0 +1,373 @@
+"""
+Micro-benchmarks for the performance sensitive parts of chess_career.
+
+Run with:
+    python -m chess_career.benchmarks
+
+The whole report pipeline can also be timed on a synthetic career (see
+synthetic.py) of 1k, 10k or 100k games:
+    python -m chess_career.benchmarks --pipeline 10k
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import shutil
+import time
+import timeit
+import tracemalloc
+from chess_career.game_record import parse_headers, movetext
+from chess_career.replay import game_fens, replay
+from chess_career.profiling import enable
+from chess_career.synthetic import write_career, SCALES, SYNTH_PLAYER
+from chess_career.synthetic import SYNTH_VERSION
+HEADER_TAGS = [
+    ("Event", "Live Chess"),
+    ("Site", "Chess.com"),
+    ("Date", "2021.07.04"),
+    ("Round", "-"),
+    ("White", "ArtVark"),
+    ("Black", "Opponent"),
+    ("Result", "1-0"),
+    ("CurrentPosition",
+     "r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 0 4"),
+    ("Timezone", "UTC"),
+    ("ECO", "C50"),
+    ("ECOUrl", "https://www.chess.com/openings/Italian-Game"),
+    ("UTCDate", "2021.07.04"),
+    ("UTCTime", "12:00:00"),
+    ("WhiteElo", "1200"),
+    ("BlackElo", "1190"),
+    ("TimeControl", "180"),
+    ("Termination", "ArtVark won by checkmate"),
+    ("StartTime", "12:00:00"),
+    ("EndDate", "2021.07.04"),
+    ("EndTime", "12:09:31"),
+    ("Link", "https://www.chess.com/game/live/12345678")
+]
+REPLAY_GAME = " ".join([
+    "1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7 6. Re1 b5",
+    "7. Bb3 d6 8. c3 O-O 9. h3 Nb8 10. d4 Nbd7 11. c4 c6 12. cxb5 axb5",
+    "13. Nc3 Bb7 14. Bg5 b4 15. Nb1 h6 16. Bh4 c5 17. dxe5 Nxe4",
+    "18. Bxe7 Qxe7 19. exd6 Qf6 20. Nbd2 Nxd6 21. Nc4 Nxc4 22. Bxc4 Nb6",
+    "23. Ne5 Rae8 24. Bxf7+ Rxf7 25. Nxf7 Rxe1+ 26. Qxe1 Kxf7 27. Qe3 Qg5",
+    "28. Qxg5 hxg5 29. b3 Ke6 30. a3 Kd6 31. axb4 cxb4 32. Ra5 Nd5",
+    "33. f3 Bc8 34. Kf2 Bf5 35. Ra7 g6 36. Ra6+ Kc5 37. Ke1 Nf4 38. g3 Nxh3",
+    "39. Kd2 Kb5 40. Rd6 Kc5 41. Ra6 Nf2 42. g4 Bd3 43. Re6 1/2-1/2"
+])
+BENCH_FORMAT = "{:<28}{:>12.2f} usec/call"
+RATE_FORMAT = "{:<28}{:>12.1f} games/sec"
+STAGE_FORMAT = "{:<28}{:>10.3f} s{:>12} MB{:>12.1f} games/sec{}"
+BENCH_DIR = "bench_career"
+HISTORY_FILE = "bench_history.jsonl"
+SCALE_FILE = "scale.json"
+BENCH_TEMPLATES = ["general_openings_report", "time_issues_report",
+                   "game_page", "display_board"]
+OUTPUT_DIRS = ["reports", "games", "positions", "templates"]
+
+
+def sample_pgn(nplies=80):
+    """
+    Return the pgn text of a game with chess.com style headers and
+    nplies clock annotated moves (the moves themselves are not legal).
+    """
+    lines = ['[{} "{}"]'.format(tag, value) for tag, value in HEADER_TAGS]
+    moves = []
+    for ply in range(nplies):
+        mnumb = ply // 2 + 1
+        secs = 1800 - ply * 10
+        clock = "0:{:02d}:{:02d}.{}".format(secs // 600, secs // 10 % 60,
+                                            secs % 10)
+        if ply % 2 == 0:
+            moves.append("{}. e4 {{[%clk {}]}}".format(mnumb, clock))
+        else:
+            moves.append("{}... e5 {{[%clk {}]}}".format(mnumb, clock))
+    return "\n".join(lines) + "\n\n" + " ".join(moves) + " 1-0\n"
+
+
+def legacy_headers(pgn):
+    """
+    Header and movetext parsing as restruct did it before parse_headers
+    was written.  Kept as the baseline for bench_header_parsers.
+    """
+    sdata = {}
+    sinfo = pgn.split(']')
+    sdata["gamerec"] = pgn.split("\n\n")[-1].strip()
+    for pair in sinfo:
+        spair = pair.strip()
+        apair = spair.split(' ')
+        back_part = " ".join(apair[1:])
+        if apair[0].startswith('['):
+            akey = apair[0][1:]
+            adata = back_part.strip('"')
+            sdata[akey] = adata
+    return sdata
+
+
+def fast_headers(pgn):
+    """
+    Header and movetext parsing as restruct does it now.
+    """
+    sdata = parse_headers(pgn)
+    sdata["gamerec"] = movetext(pgn)
+    return sdata
+
+
+def time_call(func, arg, number):
+    """
+    Return the average time (in microseconds) of func(arg).
+    """
+    return timeit.timeit(lambda: func(arg), number=number) * 1e6 / number
+
+
+def bench_header_parsers(number=20000, nplies=80):
+    """
+    Compare the old and new pgn header parsers on the same game.
+
+    Args:
+        number -- number of calls timed for each parser
+        nplies -- length of the game parsed
+
+    Returns: list of (description, microseconds per call) tuples
+    """
+    pgn = sample_pgn(nplies)
+    if legacy_headers(pgn) != fast_headers(pgn):
+        raise ValueError("header parsers disagree")
+    return [
+        ("legacy split parser", time_call(legacy_headers, pgn, number)),
+        ("parse_headers + movetext", time_call(fast_headers, pgn, number)),
+        ("parse_headers only", time_call(parse_headers, pgn, number)),
+    ]
+
+
+def replay_only(gamerec):
+    """
+    Replay a game without copying out any of its positions.
+    """
+    for _ in replay(gamerec):
+        pass
+
+
+def bench_replay(number=500, gamerec=REPLAY_GAME):
+    """
+    Measure the throughput of the SAN replay engine.
+
+    Args:
+        number -- number of times the game is replayed
+        gamerec -- move text of the game replayed
+
+    Returns: list of (description, games per second) tuples
+    """
+    return [
+        ("replay (boards only)",
+         1e6 / time_call(replay_only, gamerec, number)),
+        ("replay + fen per ply",
+         1e6 / time_call(game_fens, gamerec, number)),
+    ]
+
+
+def prepare_career(root, ngames, workers=1):
+    """
+    Set up a directory tree for running the pipeline on a synthetic
+    career.  The monthly files are written to root/data, and the working
+    directory is root/run/work (so that io_module.DATA_PATH points at
+    root/data).  The working directory gets a chess.ini, a minimal
+    version of each template and empty output directories.  The career
+    is only generated again if the number of games or SYNTH_VERSION
+    changes.
+
+    Returns: path of the working directory
+    """
+    data_dir = os.path.join(root, "data")
+    work_dir = os.path.join(root, "run", "work")
+    scale_file = os.path.join(data_dir, SCALE_FILE)
+    try:
+        with open(scale_file, 'r') as iofd:
+            current = json.load(iofd)
+    except (OSError, ValueError):
+        current = None
+    if current != [ngames, SYNTH_VERSION]:
+        shutil.rmtree(data_dir, ignore_errors=True)
+        write_career(data_dir, ngames)
+        with open(scale_file, 'w') as iofd:
+            json.dump([ngames, SYNTH_VERSION], iofd)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    for odir in OUTPUT_DIRS:
+        os.makedirs(os.path.join(work_dir, odir))
+    for template in BENCH_TEMPLATES:
+        tfile = os.path.join(work_dir, "templates", template + ".txt")
+        with open(tfile, 'w') as iofd:
+            iofd.write("<html><body><h1>General</h1><table>\n"
+                       "DATA_GOES_HERE\n</table></body></html>\n")
+    with open(os.path.join(work_dir, "chess.ini"), 'w') as iofd:
+        iofd.write("[DEFAULT]\nuser = {}\nworkers = {}\n".format(
+            SYNTH_PLAYER, workers))
+    return work_dir
+
+
+def pipeline_stages():
+    """
+    Return the list of (name, function) pairs timed by bench_pipeline.
+    Each function is an entry point that extracts the data itself, as
+    it does when run from the command line.
+    """
+    # Imported here so that the micro-benchmarks do not need the rest
+    # of the pipeline.
+    from chess_career.check_mate import collect_my_mates
+    from chess_career.extract_game import extract_data, DATA_PATH, CACHE_DIR
+    from chess_career.get_game_info import write_game_info
+    from chess_career.openings import get_openings
+    from chess_career.time_issues import get_time_issues
+
+    def cold_extract():
+        shutil.rmtree(os.path.join(DATA_PATH, CACHE_DIR), ignore_errors=True)
+        return extract_data()
+
+    return [
+        ("extract_data (cold)", cold_extract),
+        ("extract_data (cached)", extract_data),
+        ("get_openings", get_openings),
+        ("get_time_issues", get_time_issues),
+        ("collect_my_mates", collect_my_mates),
+        ("write_game_info", write_game_info),
+        ("write_game_info (rerun)", write_game_info),
+    ]
+
+
+def time_stage(func, ngames, trace_memory=True):
+    """
+    Run one pipeline stage, discarding what it prints.
+
+    Returns: dictionary of the wall time in seconds, the peak memory
+    allocated in MB (None if trace_memory is not set) and the games
+    processed per second.  Tracing memory slows the stage down, so
+    timings with and without it should not be compared.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return {"seconds": seconds, "peak_mb": peak,
+            "games_per_sec": ngames / seconds if seconds else 0.0}
+
+
+def bench_pipeline(ngames, root=BENCH_DIR, workers=1, trace_memory=True):
+    """
+    Time every pipeline stage on a synthetic career of ngames games.
+    The results are appended to HISTORY_FILE in root, so that runs can
+    be compared over time.
+
+    Returns: dictionary of the run settings and a list of results (see
+    time_stage) with a stage name added to each.
+    """
+    root = os.path.abspath(root)
+    work_dir = prepare_career(root, ngames, workers)
+    old_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        stages = []
+        for name, func in pipeline_stages():
+            result = time_stage(func, ngames, trace_memory)
+            result["stage"] = name
+            stages.append(result)
+    finally:
+        os.chdir(old_dir)
+    run = {"time": datetime.datetime.now().isoformat(timespec="seconds"),
+           "games": ngames, "workers": workers,
+           "trace_memory": trace_memory, "stages": stages}
+    with open(os.path.join(root, HISTORY_FILE), 'a') as iofd:
+        iofd.write(json.dumps(run) + "\n")
+    return run
+
+
+def previous_run(root, run):
+    """
+    Return the last run in the history file of root (before run) with
+    the same settings as run, or None if there is none.
+    """
+    last = None
+    try:
+        with open(os.path.join(root, HISTORY_FILE), 'r') as iofd:
+            for line in iofd:
+                entry = json.loads(line)
+                if entry == run:
+                    break
+                if all(entry[key] == run[key]
+                       for key in ("games", "workers", "trace_memory")):
+                    last = entry
+    except (OSError, ValueError):
+        return None
+    return last
+
+
+def print_pipeline(run, last=None):
+    """
+    Display the results of bench_pipeline, with the change in wall time
+    since the last comparable run if there is one.
+    """
+    print("Pipeline on {} synthetic games ({} workers)".format(
+        run["games"], run["workers"]))
+    old = {}
+    if last is not None:
+        old = {stage["stage"]: stage["seconds"] for stage in last["stages"]}
+    for stage in run["stages"]:
+        change = ""
+        if old.get(stage["stage"]):
+            change = "{:>+9.1f}%".format(
+                100 * (stage["seconds"] / old[stage["stage"]] - 1))
+        peak = "-"
+        if stage["peak_mb"] is not None:
+            peak = "{:.1f}".format(stage["peak_mb"])
+        print(STAGE_FORMAT.format(stage["stage"], stage["seconds"], peak,
+                                  stage["games_per_sec"], change))
+
+
+def print_results(title, results, out_format=BENCH_FORMAT):
+    """
+    Display the results of a benchmark.
+    """
+    print(title)
+    for name, value in results:
+        print(out_format.format(name, value))
+
+
+def main():
+    """
+    Run the micro-benchmarks, or the pipeline benchmark if --pipeline
+    is given.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--pipeline", metavar="SCALE",
+                        help="number of games (or one of {})".format(
+                            ", ".join(SCALES)))
+    parser.add_argument("--root", default=BENCH_DIR,
+                        help="directory for the synthetic career")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="do not trace peak memory")
+    parser.add_argument("--profile", metavar="FILE", nargs="?", const="",
+                        help="write per-stage counters as JSON to FILE "
+                        "(stderr if not given) on exit")
+    args = parser.parse_args()
+    if args.profile is not None:
+        enable(os.path.abspath(args.profile) if args.profile else None)
+    if not args.pipeline:
+        print_results("PGN header parsing", bench_header_parsers())
+        print_results("SAN replay", bench_replay(), RATE_FORMAT)
+        return
+    ngames = SCALES.get(args.pipeline) or int(args.pipeline)
+    run = bench_pipeline(ngames, args.root, args.workers,
+                         not args.no_memory)
+    print_pipeline(run, previous_run(os.path.abspath(args.root), run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Bitboard version of the checkmate analysis in check_mate.py
+
+BitPosition stores the board as one 64 bit integer per piece (bit
+row * 8 + col is set if the piece is on that square; row 0 is the first
+rank) and answers attack questions with masks that are built once at
+import time from the square tables in check_mate.py.  analyze() fills
+in the same stats (with squares reported as [row, col] lists) and
+returns the same result as Position.analyze().
+"""
+from chess_career.check_mate import (
+    BETWEEN,
+    BLOCKED,
+    BOARD_DIM,
+    DEFENSE,
+    DIAGONAL,
+    IMPORTANT_PINS,
+    KINGPOS,
+    KING_TABLE,
+    KNIGHTS,
+    KNIGHT_TABLE,
+    LINE_TYPE,
+    MATERS,
+    NSQUARES,
+    OFFENSE,
+    OPEN,
+    OPEN_DICT,
+    ORTHOGONAL,
+    PAWN_TABLE,
+    PERM_ATT_PATH,
+    PIECES,
+    PINNED
+)
+
+
+def squares_mask(squares):
+    """
+    Return the mask with the bits of squares set
+    """
+    mask = 0
+    for square in squares:
+        mask |= 1 << square
+    return mask
+
+
+def line_masks(ltype):
+    """
+    Convert check_mate's line tables for one line type into masks.
+
+    Returns a tuple of:
+        list indexed by square of the mask of all squares on those lines
+        list of lists, where entry [from][to] is the mask of the squares
+        strictly between from and to (0 if not on a common line)
+    """
+    lines = []
+    between = []
+    for square in range(NSQUARES):
+        targets = [target for target in range(NSQUARES)
+                   if LINE_TYPE[square][target] == ltype]
+        lines.append(squares_mask(targets))
+        between.append([0] * NSQUARES)
+        for target in targets:
+            between[square][target] = squares_mask(
+                [row * BOARD_DIM + col
+                 for row, col in BETWEEN[square][target]])
+    return lines, between
+
+
+KNIGHT_MASK = [squares_mask(squares) for squares in KNIGHT_TABLE]
+KING_MASK = [squares_mask(squares) & ~(1 << sq)
+             for sq, squares in enumerate(KING_TABLE)]
+PAWN_MASK = {piece: [squares_mask(squares) for squares in table]
+             for piece, table in PAWN_TABLE.items()}
+DIAGONALS, DIAG_BETWEEN = line_masks(DIAGONAL)
+ORTHOGONALS, ORTH_BETWEEN = line_masks(ORTHOGONAL)
+REACH_MASK = {
+    'n': KNIGHT_MASK,
+    'k': [mask | 1 << sq for sq, mask in enumerate(KING_MASK)],
+    'b': DIAGONALS,
+    'r': ORTHOGONALS,
+    'q': [dmask | omask for dmask, omask in zip(DIAGONALS, ORTHOGONALS)]
+}
+REACH_MASK.update({piece.upper(): REACH_MASK[piece] for piece in "nkbrq"})
+REACH_MASK.update(PAWN_MASK)
+
+
+def squares_of(mask):
+    """
+    Generator over the squares set in mask, in increasing order
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def square_loc(square):
+    """
+    Convert a square number into the [row, col] list used by Position
+    """
+    return list(divmod(square, BOARD_DIM))
+
+
+class BitPosition():
+    """
+    Bitboard representation of a position.
+
+    fen_data is the Forsyth-Edwards-Notation information input.
+    """
+    def __init__(self, fen_data):
+        self.bits = {piece: 0 for piece in PIECES + PIECES.upper()}
+        self.mailbox = [''] * NSQUARES
+        parts = fen_data.split(' ')
+        for count, rank in enumerate(parts[0].split('/')):
+            square = (BOARD_DIM - 1 - count) * BOARD_DIM
+            for fen_char in rank:
+                if fen_char.isdigit():
+                    square += int(fen_char)
+                else:
+                    self.bits[fen_char] |= 1 << square
+                    self.mailbox[square] = fen_char
+                    square += 1
+        self.occupied = 0
+        for mask in self.bits.values():
+            self.occupied |= mask
+        self.tomove = parts[1]
+        self.stats = {}
+        self.king = 0
+        self.defense = 0
+
+    def side_mask(self, side):
+        """
+        Return the mask of all squares occupied by the pieces in side
+        """
+        mask = 0
+        for piece in side:
+            mask |= self.bits[piece]
+        return mask
+
+    def analyze(self):
+        """
+        Analyze features of this checkmate position.
+        """
+        if self.tomove == 'b':
+            self.stats[DEFENSE] = PIECES
+            self.stats[OFFENSE] = PIECES.upper()
+        else:
+            self.stats[DEFENSE] = PIECES.upper()
+            self.stats[OFFENSE] = PIECES
+        self.defense = self.side_mask(self.stats[DEFENSE])
+        self.king = next(squares_of(self.bits[self.stats[DEFENSE][-1]]))
+        self.stats[KINGPOS] = square_loc(self.king)
+        self.stats[PERM_ATT_PATH] = []
+        self.stats[PINNED] = []
+        self.stats[IMPORTANT_PINS] = []
+        self.stats[MATERS] = []
+        near = KING_MASK[self.king]
+        open_mask = near & ~self.defense
+        self.stats[BLOCKED] = [square_loc(sq)
+                               for sq in squares_of(near & self.defense)]
+        self.stats[OPEN] = [square_loc(sq) for sq in squares_of(open_mask)]
+        self.stats[OPEN_DICT] = {sq: [] for sq in squares_of(open_mask)}
+        offense = self.side_mask(self.stats[OFFENSE])
+        king_bit = 1 << self.king
+        open_list = list(squares_of(open_mask))
+        for from_sq in squares_of(offense):
+            reach = (REACH_MASK[self.mailbox[from_sq]][from_sq] &
+                     (open_mask | king_bit))
+            if not reach:
+                continue
+            if reach & king_bit and self.attacks(from_sq, self.king):
+                self.stats[MATERS].append(square_loc(from_sq))
+                self.stats[PERM_ATT_PATH] = self.attack_path(from_sq)
+            for to_sq in open_list:
+                if reach >> to_sq & 1 and self.attacks(from_sq, to_sq):
+                    self.stats[OPEN_DICT][to_sq].append(square_loc(from_sq))
+        self.resolve_pins()
+        if len(self.stats[MATERS]) > 1:
+            return "Double Check"
+        mrow, mcol = self.stats[MATERS][0]
+        if self.mailbox[mrow * BOARD_DIM + mcol] in KNIGHTS:
+            if self.stats[OPEN] == []:
+                return "Smother Mate"
+        return False
+
+    def attacks(self, from_sq, to_sq):
+        """
+        True if the attacking piece on from_sq attacks to_sq.  Like
+        Position.check_between, a single defender between a sliding
+        piece and the king is recorded as pinned.
+        """
+        piece = self.mailbox[from_sq]
+        kind = piece.lower()
+        if kind == 'n':
+            return bool(KNIGHT_MASK[from_sq] >> to_sq & 1)
+        if kind == 'k':
+            return from_sq == to_sq or bool(KING_MASK[from_sq] >> to_sq & 1)
+        if kind == 'p':
+            return bool(PAWN_MASK[piece][from_sq] >> to_sq & 1)
+        blockers = self.slider_blockers(kind, from_sq, to_sq)
+        if blockers is None:
+            return False
+        if blockers == 0:
+            return True
+        if blockers & (blockers - 1) == 0 and blockers & self.defense:
+            if to_sq == self.king:
+                pinned_sq = blockers.bit_length() - 1
+                self.stats[PINNED].append(
+                    [square_loc(from_sq), square_loc(pinned_sq)])
+        return False
+
+    def slider_blockers(self, kind, from_sq, to_sq):
+        """
+        Return the mask of pieces (other than the defending king) between
+        a bishop, rook or queen on from_sq and to_sq, or None if the piece
+        does not move along a line through to_sq.
+        """
+        if kind != 'r' and DIAGONALS[from_sq] >> to_sq & 1:
+            between = DIAG_BETWEEN[from_sq][to_sq]
+        elif kind != 'b' and ORTHOGONALS[from_sq] >> to_sq & 1:
+            between = ORTH_BETWEEN[from_sq][to_sq]
+        else:
+            return None
+        return between & self.occupied & ~(1 << self.king)
+
+    def attack_path(self, from_sq):
+        """
+        Return the squares that a defender could move to in order to stop
+        a check from from_sq: the squares between the king and the
+        attacker, ordered outward from the king, followed by the
+        attacker's square.
+        """
+        between = (DIAG_BETWEEN[from_sq][self.king] |
+                   ORTH_BETWEEN[from_sq][self.king])
+        path = sorted(squares_of(between),
+                      key=lambda sq: abs(sq - self.king))
+        path.append(from_sq)
+        return [square_loc(sq) for sq in path]
+
+    def defender_reaches(self, from_sq, to_sq):
+        """
+        True if the defending piece on from_sq can move to to_sq.
+        """
+        piece = self.mailbox[from_sq]
+        kind = piece.lower()
+        if kind == 'n':
+            return bool(KNIGHT_MASK[from_sq] >> to_sq & 1)
+        if kind == 'k':
+            return from_sq == to_sq or bool(KING_MASK[from_sq] >> to_sq & 1)
+        if kind == 'p':
+            return self.pawn_reaches(piece, from_sq, to_sq)
+        if from_sq == to_sq:
+            return False
+        return self.slider_blockers(kind, from_sq, to_sq) == 0
+
+    def pawn_reaches(self, piece, from_sq, to_sq):
+        """
+        True if a defending pawn can capture on or advance to to_sq
+        (the same rules as Position.pawn_move for a defending pawn).
+        """
+        target = 1 << to_sq
+        if PAWN_MASK[piece][from_sq] & target & self.occupied:
+            return True
+        step = BOARD_DIM if piece.isupper() else -BOARD_DIM
+        if to_sq == from_sq + step:
+            return not self.occupied & target
+        start_row = 1 if piece.isupper() else BOARD_DIM - 2
+        if to_sq != from_sq + 2 * step or from_sq // BOARD_DIM != start_row:
+            return False
+        # Position.p_doublestep checks the square two rows past to_sq
+        # rather than to_sq itself; do the same so the results agree.
+        return not self.occupied & (1 << (from_sq + step) |
+                                    1 << (to_sq + 2 * step))
+
+    def resolve_pins(self):
+        """
+        Handle cases where a piece cannot capture or interpose
+        because it is pinned
+        """
+        if len(self.stats[MATERS]) > 1:
+            return
+        path = [row * BOARD_DIM + col
+                for row, col in self.stats[PERM_ATT_PATH]]
+        for entry in self.stats[PINNED]:
+            pinned_sq = entry[1][0] * BOARD_DIM + entry[1][1]
+            for to_sq in path:
+                if self.defender_reaches(pinned_sq, to_sq):
+                    self.stats[IMPORTANT_PINS].append(entry)
+                    break
@@ -2,11 +2,15 @@
 Look at my checkmates
 """
 import os
+from concurrent.futures import ProcessPoolExecutor
 from chess_career.extract_game import extract_data, TERMINATION
 from chess_career.io_module import get_header_trailer
 from chess_career.utilities import CURRENT_POSITION
 
-from chess_career.extract_game import O_ALL_DATA, O_MYWINS
+from chess_career.extract_game import O_ALL_DATA, O_MYWINS, O_WORKERS
+from chess_career.extract_game import window_games
+from chess_career.io_module import DATE
+from chess_career.profiling import pool_map, tally, timed
 PERM_ATT_PATH = "permanent_attack_path"
 IMPORTANT_PINS = "important_pins"
 DEFENSE = "defense"
@@ -27,6 +31,18 @@ BISHOPS = "bB"
 ROOKS = "rR"
 KINGS = "kK"
 SQUARE_SIZE = 60
+MATE_CHUNK = 50
+NSQUARES = BOARD_DIM * BOARD_DIM
+DIAGONAL = "diagonal"
+ORTHOGONAL = "orthogonal"
+KNIGHT_STEPS = [(1, 2), (2, 1), (2, -1), (1, -2),
+                (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+KING_STEPS = [(1, 0), (1, 1), (0, 1), (-1, 1),
+              (-1, 0), (-1, -1), (0, -1), (1, -1)]
+LINE_STEPS = {
+    DIAGONAL: [(1, 1), (-1, 1), (-1, -1), (1, -1)],
+    ORTHOGONAL: [(1, 0), (0, 1), (-1, 0), (0, -1)]
+}
 PIECE_IMAGE = {
     'P': "0/04/Chess_plt60",
     'R': "5/5c/Chess_rlt60",
@@ -43,6 +59,72 @@ PIECE_IMAGE = {
 }
 
 
+def on_board(row, col):
+    """
+    True if row and col are on the board
+    """
+    return 0 <= row < BOARD_DIM and 0 <= col < BOARD_DIM
+
+
+def step_table(steps, include_self=False):
+    """
+    Return a list indexed by square number (row * BOARD_DIM + col) of the
+    frozenset of square numbers reached by one of steps.
+    """
+    table = []
+    for square in range(NSQUARES):
+        row, col = divmod(square, BOARD_DIM)
+        reached = set()
+        if include_self:
+            reached.add(square)
+        for rstep, cstep in steps:
+            if on_board(row + rstep, col + cstep):
+                reached.add((row + rstep) * BOARD_DIM + col + cstep)
+        table.append(frozenset(reached))
+    return table
+
+
+def line_tables():
+    """
+    Return a tuple of two lists of lists indexed by [from][to] square
+    numbers.  The first holds DIAGONAL or ORTHOGONAL if the squares share
+    a line (None otherwise).  The second holds the tuple of (row, col)
+    locations strictly between the two, ordered starting next to the to
+    square.
+    """
+    line_type = [[None] * NSQUARES for _ in range(NSQUARES)]
+    between = [[()] * NSQUARES for _ in range(NSQUARES)]
+    for square in range(NSQUARES):
+        row, col = divmod(square, BOARD_DIM)
+        for ltype, steps in LINE_STEPS.items():
+            for rstep, cstep in steps:
+                path = []
+                trow, tcol = row + rstep, col + cstep
+                while on_board(trow, tcol):
+                    target = trow * BOARD_DIM + tcol
+                    line_type[square][target] = ltype
+                    between[square][target] = tuple(reversed(path))
+                    path.append((trow, tcol))
+                    trow, tcol = trow + rstep, tcol + cstep
+    return line_type, between
+
+
+KNIGHT_TABLE = step_table(KNIGHT_STEPS)
+KING_TABLE = step_table(KING_STEPS, include_self=True)
+PAWN_TABLE = {
+    'P': step_table([(1, -1), (1, 1)]),
+    'p': step_table([(-1, -1), (-1, 1)])
+}
+LINE_TYPE, BETWEEN = line_tables()
+
+
+def square_index(loc):
+    """
+    Convert a [row, col] location into a square number
+    """
+    return loc[0] * BOARD_DIM + loc[1]
+
+
 class Position():
     """
     Save information for a game
@@ -64,6 +146,7 @@ class Position():
                     self.board[crow][column] = fen_char
                     column += 1
         self.tomove = parts[1]
+        self.king_loc = None
         self.out_sections = []
         self.stats = {}
         self.stats[MOVE_TABLE] = {
@@ -151,6 +234,7 @@ class Position():
                 if (self.board[row][col] in self.stats[DEFENSE] and
                         self.board[row][col] in KINGS):
                     self.stats[KINGPOS] = [row, col]
+                    self.king_loc = (row, col)
                     row = BOARD_DIM
                     break
         self.stats[PERM_ATT_PATH] = []
@@ -239,10 +323,8 @@ class Position():
         if p_to_move.islower():
             direction = -1
             p_row = from_loc[0] == 6
-        take_possible = False
-        if to_loc[0] - from_loc[0] == direction:
-            if abs(to_loc[1] - from_loc[1]) == 1:
-                take_possible = True
+        from_sq = square_index(from_loc)
+        take_possible = square_index(to_loc) in PAWN_TABLE[p_to_move][from_sq]
         if p_to_move in self.stats[OFFENSE] and not p_to_move == "":
             if take_possible:
                 return True
@@ -273,15 +355,12 @@ class Position():
         """
         Handle orthogonal and diagonal moves
         """
-        xdiff = to_loc[0] - from_loc[0]
-        ydiff = to_loc[1] - from_loc[1]
-        factor = abs(xdiff)
-        if factor == 0:
-            factor = abs(ydiff)
-        if abs(xdiff) == abs(ydiff):
+        line = LINE_TYPE[from_loc[0] * BOARD_DIM + from_loc[1]][
+            to_loc[0] * BOARD_DIM + to_loc[1]]
+        if line == DIAGONAL:
             if self.board[from_loc[0]][from_loc[1]] not in ROOKS:
                 return self.check_between(from_loc, to_loc)
-        if xdiff * ydiff == 0:
+        if line == ORTHOGONAL:
             if self.board[from_loc[0]][from_loc[1]] not in BISHOPS:
                 return self.check_between(from_loc, to_loc)
         return False
@@ -293,38 +372,27 @@ class Position():
         """
         if from_loc == to_loc:
             return False
-        xdiff = to_loc[0] - from_loc[0]
-        ydiff = to_loc[1] - from_loc[1]
-        factor = max([abs(xdiff), abs(ydiff)])
-        xdiff //= factor
-        ydiff //= factor
-        if factor == 1:
-            return True
-        chk_loc = to_loc[:]
-        factor -= 1
-        interf = []
-        while factor > 0:
-            factor -= 1
-            chk_loc[0] -= xdiff
-            chk_loc[1] -= ydiff
-            if chk_loc == self.stats[KINGPOS]:
+        to_king = to_loc == self.stats[KINGPOS]
+        blocker = None
+        for loc in BETWEEN[from_loc[0] * BOARD_DIM + from_loc[1]][
+                to_loc[0] * BOARD_DIM + to_loc[1]]:
+            if loc == self.king_loc:
                 continue
-            if self.board[chk_loc[0]][chk_loc[1]] == '':
-                if to_loc == self.stats[KINGPOS]:
-                    self.stats[ATTACK_PATH].append(chk_loc[:])
+            if self.board[loc[0]][loc[1]] == '':
+                if to_king:
+                    self.stats[ATTACK_PATH].append(list(loc))
                 continue
-            interf.append(chk_loc[:])
-        if not interf:
+            if blocker is not None:
+                self.stats[ATTACK_PATH] = []
+                return False
+            blocker = loc
+        if blocker is None:
             return True
         self.stats[ATTACK_PATH] = []
-        if len(interf) > 1:
-            return False
-        iloc = interf[0]
-        if self.board[iloc[0]][iloc[1]] == "":
-            return False
-        if self.board[iloc[0]][iloc[1]] in self.stats[DEFENSE]:
-            if to_loc == self.stats[KINGPOS]:
-                self.stats[PINNED].append([from_loc, iloc])
+        row, col = blocker
+        if self.board[row][col] in self.stats[DEFENSE]:
+            if to_king:
+                self.stats[PINNED].append([from_loc, [row, col]])
         return False
 
     def resolve_pins(self):
@@ -347,40 +415,114 @@ def knight_move(from_loc, to_loc):
     """
     True if a knight at from_loc can move to to_loc
     """
-    xdim = from_loc[0] - to_loc[0]
-    ydim = from_loc[1] - to_loc[1]
-    if abs(xdim * ydim) == 2:
-        return True
-    return False
+    return (to_loc[0] * BOARD_DIM + to_loc[1] in
+            KNIGHT_TABLE[from_loc[0] * BOARD_DIM + from_loc[1]])
 
 
 def king_move(from_loc, to_loc):
     """
     True if a king at from_loc can move to to_loc
     """
-    if abs(from_loc[0] - to_loc[0]) > 1:
-        return False
-    if abs(from_loc[1] - to_loc[1]) > 1:
-        return False
-    return True
+    return (to_loc[0] * BOARD_DIM + to_loc[1] in
+            KING_TABLE[from_loc[0] * BOARD_DIM + from_loc[1]])
 
 
-def collect_my_mates():
+def my_mate_list(data, window=None):
     """
-    Run the display_mate program on all my checkmates.
+    Find the games I won by checkmate.
+
+    Args:
+        data -- value returned by extract_data
+        window -- only look at games inside this time window (see
+                  extract_game.window_games).  All games if not set.
+
+    Returns: list of (game number, final position, white player,
+    black player, date) tuples, in game number order.
     """
-    data = extract_data()
+    games = window_games(data, window)
+    mates = []
     for gnumb in data[O_MYWINS]:
+        if gnumb not in games:
+            continue
         game = data[O_ALL_DATA][gnumb]
         if game[TERMINATION].endswith("checkmate"):
-            endpos = Position(game[CURRENT_POSITION])
-            endpos.display_mate(gnumb)
-            ostr = endpos.analyze()
-            if ostr:
-                ostr += " -- " + game['white']['username'] + " vs "
-                ostr += game['black']['username'] + " " + game["Date"]
-                ostr += " (" + str(gnumb) + ")"
-                print(ostr)
+            mates.append((gnumb, game[CURRENT_POSITION],
+                          game.white_name, game.black_name,
+                          game[DATE]))
+    return mates
+
+
+@timed("analyze_mates")
+def analyze_mates(mates):
+    """
+    Display and analyze a group of checkmates.  This runs in a worker
+    process when collect_my_mates uses a process pool.  The analysis is
+    done on a bitboard.BitPosition; the list based Position is only used
+    to display the board.
+
+    Args:
+        mates -- list of entries returned by my_mate_list
+
+    Returns: list of (pattern, white player, black player, date, game
+    number) tuples for the mates where a pattern was found.
+    """
+    # Imported here because bitboard builds its masks from the tables
+    # in this module.
+    from chess_career.bitboard import BitPosition
+    tally("analyze_mates", games=len(mates))
+    summary = []
+    for gnumb, fen, white, black, date in mates:
+        Position(fen).display_mate(gnumb)
+        pattern = BitPosition(fen).analyze()
+        if pattern:
+            summary.append((pattern, white, black, date, gnumb))
+    return summary
+
+
+def format_mate(entry):
+    """
+    Return the display line for one entry of the collect_my_mates summary
+    """
+    pattern, white, black, date, gnumb = entry
+    return "{} -- {} vs {} {} ({})".format(pattern, white, black, date, gnumb)
+
+
+@timed("collect_my_mates")
+def collect_my_mates(workers=None, window=None, data=None):
+    """
+    Run the display_mate program on all my checkmates.
+
+    The mates are split into chunks of MATE_CHUNK games which are
+    analyzed by a pool of worker processes.  The results are printed
+    in game order once every chunk is done.
+
+    Args:
+        workers -- number of processes to use.  Uses the workers setting
+                   from chess.ini if not set.
+        window -- only look at games inside this time window (see
+                  extract_game.window_games).  All games if not set.
+        data -- value returned by extract_data.  extract_data is called
+                if not set.
+
+    Returns: list of (pattern, white player, black player, date, game
+    number) tuples for the mates where a pattern was found.
+    """
+    if data is None:
+        data = extract_data()
+    if workers is None:
+        workers = data[O_WORKERS]
+    mates = my_mate_list(data, window)
+    chunks = [mates[indx:indx + MATE_CHUNK]
+              for indx in range(0, len(mates), MATE_CHUNK)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool_map(pool, analyze_mates, chunks))
+    else:
+        results = [analyze_mates(chunk) for chunk in chunks]
+    summary = [entry for chunk in results for entry in chunk]
+    for entry in summary:
+        print(format_mate(entry))
+    return summary
 
 
 if __name__ == "__main__":
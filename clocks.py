@@ -0,0 +1,166 @@
+"""
+Per-move clock information for a whole career.
+
+The %clk annotations of every game are parsed once into flat arrays
+holding, for each ply, the time left on the mover's clock and the time
+spent on that move.  Queries about how time was used then only look at
+these arrays.  All times are in 1/10 second units.
+"""
+from array import array
+from statistics import median
+from chess_career.extract_game import O_ALL_DATA
+from chess_career.game_record import TIMECONTROL
+from chess_career.columns import get_columns, C_COLOR
+from chess_career.utilities import clock_list, GAMEREC
+O_CLOCKS = "clocks"
+CS_OFFSETS = "offsets"
+CS_REMAINING = "remaining"
+CS_SPENT = "spent"
+
+
+def time_control(game):
+    """
+    Return the base time and increment of a game as a tuple of 1/10
+    second values.  The base time is None if it is unknown (daily games
+    or a missing TimeControl tag).
+    """
+    tcontrol = game.get(TIMECONTROL, "")
+    if not tcontrol or "/" in tcontrol:
+        return None, 0
+    base, _, incr = tcontrol.partition("+")
+    try:
+        return int(base) * 10, int(incr or 0) * 10
+    except ValueError:
+        return None, 0
+
+
+def spent_times(remaining, base, increment):
+    """
+    Compute the time spent on each ply.
+
+    Args:
+        remaining -- clock values after each ply
+        base -- starting clock value (None if unknown)
+        increment -- time added to the clock after each move
+
+    Returns: array of time spent on each ply.  If the starting clock is
+    unknown, each side's first move is treated as taking no time.
+    """
+    spent = array('l')
+    for ply, value in enumerate(remaining):
+        if ply >= 2:
+            before = remaining[ply - 2]
+        elif base is not None:
+            before = base
+        else:
+            before = value - increment
+        spent.append(before + increment - value)
+    return spent
+
+
+def build_clock_series(data):
+    """
+    Parse the clock annotations of every game.
+
+    Args:
+        data -- value returned by extract_data
+
+    Returns a dictionary of arrays:
+
+    CS_REMAINING -- clock value after each ply of every game, one game
+                    after another
+    CS_SPENT -- time spent on each ply, in the same layout
+    CS_OFFSETS -- position in the other two arrays where each game
+                  starts.  Game gnumb covers the entries from
+                  CS_OFFSETS[gnumb] up to CS_OFFSETS[gnumb + 1].
+    """
+    series = {
+        CS_OFFSETS: array('L', [0]),
+        CS_REMAINING: array('l'),
+        CS_SPENT: array('l')
+    }
+    for game in data[O_ALL_DATA]:
+        remaining = array('l', clock_list(game[GAMEREC]))
+        base, increment = time_control(game)
+        series[CS_REMAINING].extend(remaining)
+        series[CS_SPENT].extend(spent_times(remaining, base, increment))
+        series[CS_OFFSETS].append(len(series[CS_REMAINING]))
+    return series
+
+
+def get_clock_series(data):
+    """
+    Return the clock series for extract_data output, building it the
+    first time it is asked for.  The series is saved in data under
+    O_CLOCKS so that later queries do not parse the moves again.
+    """
+    if O_CLOCKS not in data:
+        data[O_CLOCKS] = build_clock_series(data)
+    return data[O_CLOCKS]
+
+
+def game_clocks(data, gnumb):
+    """
+    Return the clock values and time spent on each ply of one game, as
+    a tuple of two arrays.
+    """
+    series = get_clock_series(data)
+    start = series[CS_OFFSETS][gnumb]
+    end = series[CS_OFFSETS][gnumb + 1]
+    return series[CS_REMAINING][start:end], series[CS_SPENT][start:end]
+
+
+def my_plies(data, gnumb, first_move=1, last_move=None):
+    """
+    Return the range of plies that I played in one game between move
+    numbers first_move and last_move (inclusive).  Ply 0 is white's
+    first move.
+    """
+    series = get_clock_series(data)
+    nplies = series[CS_OFFSETS][gnumb + 1] - series[CS_OFFSETS][gnumb]
+    color = get_columns(data)[C_COLOR][gnumb]
+    end = nplies if last_move is None else min(nplies, 2 * last_move)
+    return range(2 * (first_move - 1) + color, end, 2)
+
+
+def think_times(data, first_move=1, last_move=None):
+    """
+    Collect the time I spent on each of my moves between move numbers
+    first_move and last_move (inclusive), over all games.
+
+    Returns: array of time spent values
+    """
+    series = get_clock_series(data)
+    spent = series[CS_SPENT]
+    retval = array('l')
+    for gnumb in range(len(series[CS_OFFSETS]) - 1):
+        start = series[CS_OFFSETS][gnumb]
+        for ply in my_plies(data, gnumb, first_move, last_move):
+            retval.append(spent[start + ply])
+    return retval
+
+
+def median_think_time(data, first_move=1, last_move=None):
+    """
+    Return my median time spent per move between move numbers
+    first_move and last_move (inclusive), or None if there are no
+    clock annotated moves in that range.
+    """
+    times = think_times(data, first_move, last_move)
+    if not times:
+        return None
+    return median(times)
+
+
+def first_ply_under(data, gnumb, threshold):
+    """
+    Return the first ply of a game after which my clock was under
+    threshold, or -1 if it never was.
+    """
+    series = get_clock_series(data)
+    remaining = series[CS_REMAINING]
+    start = series[CS_OFFSETS][gnumb]
+    for ply in my_plies(data, gnumb):
+        if remaining[start + ply] < threshold:
+            return ply
+    return -1
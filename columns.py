@@ -0,0 +1,154 @@
+"""
+Columnar representation of extracted game data.
+
+Each column is a compact typed array indexed by game number, so that
+reports can make passes over plain numbers instead of parsing the PGN
+strings in every game dictionary.
+"""
+from array import array
+from chess_career.extract_game import (
+    O_ALL_DATA,
+    O_DRAW_TYPES,
+    O_INDEX,
+    O_MYWINS,
+    O_DRAWS,
+    O_WHITE,
+    O_WININFO,
+    O_TIMES
+)
+from chess_career.utilities import (
+    get_times,
+    material,
+    CURRENT_POSITION,
+    ECOURL
+)
+from chess_career.profiling import timed
+O_COLUMNS = "columns"
+C_END_TIME = "end_time"
+C_COLOR = "color"
+C_RESULT = "result"
+C_TERM = "termination"
+C_TOMOVE = "tomove"
+C_MATERIAL = "material"
+C_WCLOCK = "white_clock"
+C_BCLOCK = "black_clock"
+C_OPENING = "opening"
+C_TERM_NAMES = "termination_names"
+C_OPENING_NAMES = "opening_names"
+RES_LOSS = -1
+RES_DRAW = 0
+RES_WIN = 1
+NO_CLOCK = -1
+UNKNOWN_OPENING = "Unknown-Opening"
+
+
+def opening_name(game):
+    """
+    Return the name of the opening played (the last part of the ECOUrl
+    tag).
+    """
+    if ECOURL in game:
+        return game[ECOURL].split("/")[-1]
+    return UNKNOWN_OPENING
+
+
+@timed("build_columns")
+def build_columns(data):
+    """
+    Convert extract_data output into columns.
+
+    Args:
+        data -- value returned by extract_data
+
+    Returns a dictionary of the following arrays, each indexed by game
+    number:
+
+    C_END_TIME -- time the game ended (seconds)
+    C_COLOR -- 0 if I played white, 1 if I played black
+    C_RESULT -- RES_WIN, RES_DRAW or RES_LOSS
+    C_TERM -- termination code (index into C_TERM_NAMES)
+    C_TOMOVE -- 0 if white is to move in the final position, 1 if black
+    C_MATERIAL -- final material balance (positive if white is ahead)
+    C_WCLOCK -- white's final clock in 1/10 seconds (NO_CLOCK if unknown)
+    C_BCLOCK -- black's final clock in 1/10 seconds (NO_CLOCK if unknown)
+    C_OPENING -- opening code (index into C_OPENING_NAMES)
+
+    plus the two lists of names that the codes refer to:
+
+    C_TERM_NAMES -- termination types (keys of O_DRAW_TYPES and O_WININFO)
+    C_OPENING_NAMES -- openings, in the order they were first played
+    """
+    index = data[O_INDEX]
+    term_names = sorted(list(data[O_DRAW_TYPES]) + list(data[O_WININFO]))
+    term_codes = {}
+    for code, term in enumerate(term_names):
+        for gnumb in index[term]:
+            term_codes[gnumb] = code
+    opening_codes = {}
+    cols = {
+        C_END_TIME: array('q', data[O_TIMES]),
+        C_COLOR: array('b'),
+        C_RESULT: array('b'),
+        C_TERM: array('H'),
+        C_TOMOVE: array('b'),
+        C_MATERIAL: array('h'),
+        C_WCLOCK: array('l'),
+        C_BCLOCK: array('l'),
+        C_OPENING: array('H'),
+        C_TERM_NAMES: term_names,
+        C_OPENING_NAMES: []
+    }
+    for count, game in enumerate(data[O_ALL_DATA]):
+        cols[C_COLOR].append(0 if count in index[O_WHITE] else 1)
+        if count in index[O_MYWINS]:
+            cols[C_RESULT].append(RES_WIN)
+        elif count in index[O_DRAWS]:
+            cols[C_RESULT].append(RES_DRAW)
+        else:
+            cols[C_RESULT].append(RES_LOSS)
+        cols[C_TERM].append(term_codes[count])
+        tomove = game[CURRENT_POSITION].split(' ')[1]
+        cols[C_TOMOVE].append("wb".find(tomove))
+        cols[C_MATERIAL].append(material(game))
+        timevec = get_times(game)
+        if not timevec:
+            timevec = [NO_CLOCK, NO_CLOCK]
+        cols[C_WCLOCK].append(timevec[0])
+        cols[C_BCLOCK].append(timevec[1])
+        opening = opening_name(game)
+        if opening not in opening_codes:
+            opening_codes[opening] = len(cols[C_OPENING_NAMES])
+            cols[C_OPENING_NAMES].append(opening)
+        cols[C_OPENING].append(opening_codes[opening])
+    return cols
+
+
+def get_columns(data):
+    """
+    Return the columns for extract_data output, building them the first
+    time they are asked for.  The columns are saved in data under
+    O_COLUMNS so that every report using the same data shares them.
+    """
+    if O_COLUMNS not in data:
+        data[O_COLUMNS] = build_columns(data)
+    return data[O_COLUMNS]
+
+
+def player_clocks(cols):
+    """
+    Return an array of my final clock values (1/10 seconds, NO_CLOCK if
+    unknown), indexed by game number.
+    """
+    clocks = (cols[C_WCLOCK], cols[C_BCLOCK])
+    return array('l', [clocks[color][count]
+                       for count, color in enumerate(cols[C_COLOR])])
+
+
+def player_material(cols):
+    """
+    Return an array of final material balances from my point of view
+    (positive if I am ahead), indexed by game number.
+    """
+    return array('h', [points if color == 0 else -points
+                       for points, color in zip(cols[C_MATERIAL],
+                                                cols[C_COLOR])])
@@ -2,28 +2,42 @@
 Read json files in data directory and collect a complete
 list of games.
 """
+from array import array
+from bisect import bisect_left
 import configparser
 import datetime
+from concurrent.futures import ProcessPoolExecutor
 import json
 import os
+import pickle
 from chess_career.io_module import copy_files, DEFAULT, DATA_PATH, JSON
+from chess_career.io_module import is_month_file, data_path
 from chess_career.utilities import GAMEREC, CURRENT_POSITION
-from chess_career.io_module import BLACK, WHITE, DATE
+from chess_career.io_module import DATE
+from chess_career.game_record import GameRecord
+from chess_career.game_record import ENDDATE, ENDTIME, TERMINATION
+from chess_career.profiling import pool_map, tally, section, timed
 USER = "user"
-ENDTIME = "EndTime"
+WORKERS = "workers"
 O_ALL_DATA = "all_data"
+O_CHANGED = "changed"
 O_DRAW_TYPES = "draw_types"
 O_DRAWS = "draws"
+O_INDEX = "index"
 O_MYWINS = "mywins"
 O_PLAYER = "player"
 O_WHITE = "awhite"
 O_WININFO = "wininfo"
 O_WLASTMV = "wlastmv"
-PGN = "pgn"
+O_WORKERS = "workers"
+O_TIMES = "times"
+O_DATA_PATH = "data_path"
 GAMES = "games"
 DRAWN = "drawn"
-USERNAME = "username"
-TERMINATION = "Termination"
+CACHE_DIR = "cache"
+CACHE_SUFFIX = ".pickle"
+CACHE_VERSION = 4
+MONTHS_AHEAD = 2
 
 
 def restruct(entry):
@@ -33,66 +47,262 @@ def restruct(entry):
 
     Returns a tuple consisting of:
         timestamp -- in seconds
-        a reformmated dictionary of game information
+        a GameRecord of game information (indexed like a dictionary)
 
     Args:
         entry -- game object
     """
-    sdata = {}
-    sdata[WHITE] = entry[WHITE]
-    sdata[BLACK] = entry[BLACK]
-    sinfo = entry[PGN].split(']')
-    sdata[GAMEREC] = entry[PGN].split("\n\n")[-1].strip()
-    for pair in sinfo:
-        spair = pair.strip()
-        apair = spair.split(' ')
-        back_part = " ".join(apair[1:])
-        if apair[0].startswith('['):
-            akey = apair[0][1:]
-            adata = back_part.strip('"')
-            sdata[akey] = adata
-    dayinfo = sdata[DATE].split(".")
-    timeinfo = sdata[ENDTIME].split(":")
-    new_dict_key = int(datetime.datetime(
+    sdata = GameRecord(entry)
+    return game_timestamp(sdata), sdata
+
+
+def game_timestamp(game):
+    """
+    Return the time (in seconds) that a game ended.  The EndDate tag is
+    used (Date is the day the game started), falling back on Date for
+    games without an EndDate.
+
+    Args:
+        game -- game data
+    """
+    dayinfo = game.get(ENDDATE, game[DATE]).split(".")
+    timeinfo = game[ENDTIME].split(":")
+    return int(datetime.datetime(
         int(dayinfo[0]), int(dayinfo[1]), int(dayinfo[2]),
         int(timeinfo[0]), int(timeinfo[1]), int(timeinfo[2])
     ).timestamp())
-    return new_dict_key, sdata
 
 
-def get_all_game_data():
+def read_month(jfile):
     """
-    Return list of all games played (each entry is a dictionary)
-    representing data
+    Parse a monthly json file.
+
+    Args:
+        jfile -- path of a yYYYYmMM.json file
+
+    Returns: list of the games in that file (each entry is a dictionary),
+    sorted by the time each game ended.
+    """
+    month_dict = {}
+    with section("json_decode"), open(jfile, 'r') as jfile_fd:
+        glist = json.load(jfile_fd)
+        tally("json_decode", bytes_read=jfile_fd.tell())
+    with section("restruct"):
+        for entry in glist[GAMES]:
+            mkey, mdata = restruct(entry)
+            month_dict[mkey] = mdata
+        tally("restruct", games=len(glist[GAMES]))
+    klist = sorted(month_dict.keys())
+    return [month_dict[indx] for indx in klist]
+
+
+def cache_file(jfile):
+    """
+    Return the name of the file holding the parsed version of jfile.
+    Cache files live in a cache subdirectory next to the json files.
+    """
+    jdir, jname = os.path.split(jfile)
+    return os.path.join(jdir, CACHE_DIR, jname[:-len(JSON)] + CACHE_SUFFIX)
+
+
+def cache_key(jfile):
+    """
+    Return the key identifying the current contents of jfile.  A cached
+    month is only used if the cache version, file path, file size and
+    modification time all still match.
+    """
+    fstat = os.stat(jfile)
+    return (CACHE_VERSION, os.path.abspath(jfile), fstat.st_size,
+            fstat.st_mtime_ns)
+
+
+@timed("load_month")
+def load_month(jfile):
+    """
+    Return the list of games in a monthly json file.  The parsed list is
+    pickled to the cache directory so that later runs only parse months
+    that are new or have changed.
+
+    Args:
+        jfile -- path of a yYYYYmMM.json file
+    """
+    ckey = cache_key(jfile)
+    cfile = cache_file(jfile)
+    month_list = read_cache(cfile, ckey)
+    if month_list is None:
+        month_list = read_month(jfile)
+        write_cache(cfile, ckey, month_list)
+    tally("load_month", games=len(month_list))
+    return month_list
+
+
+def read_cache(cfile, ckey):
+    """
+    Return the value saved in cache file cfile, or None if the file is
+    missing, unreadable, or was saved under a key other than ckey.
+    """
+    try:
+        with open(cfile, 'rb') as cfd:
+            if pickle.load(cfd) == ckey:
+                return pickle.load(cfd)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    return None
+
+
+def write_cache(cfile, ckey, value):
+    """
+    Save value and the key ckey that it is valid for in cache file
+    cfile.  The file is written under a temporary name and then renamed,
+    so readers never see a partly written cache.
+    """
+    os.makedirs(os.path.dirname(cfile), exist_ok=True)
+    tfile = "{}.{}".format(cfile, os.getpid())
+    with open(tfile, 'wb') as cfd:
+        pickle.dump(ckey, cfd, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(value, cfd, pickle.HIGHEST_PROTOCOL)
+    os.replace(tfile, cfile)
+
+
+def month_files(data_dir=DATA_PATH):
+    """
+    Return the sorted (and therefore chronological) list of paths of
+    the monthly json files in the data directory.
     """
-    return_list = []
     file_list = []
-    j_locs = os.listdir(DATA_PATH)
+    j_locs = os.listdir(data_dir)
     for jfile in j_locs:
-        if jfile.endswith(JSON):
-            file_list.append(os.path.join(DATA_PATH, jfile))
-    file_list = sorted(file_list)
+        if is_month_file(jfile):
+            file_list.append(os.path.join(data_dir, jfile))
+    return sorted(file_list)
+
+
+def iter_months(workers=1, data_dir=DATA_PATH):
+    """
+    Generator over the monthly files.  Only one month of games is held
+    in memory at a time (with a process pool, at most workers *
+    MONTHS_AHEAD more months wait to be yielded).
+
+    Args:
+        workers -- number of processes used to parse monthly files.  If
+                   more than 1, months are parsed in parallel by a process
+                   pool but are still yielded in chronological order.
+                   At most MONTHS_AHEAD months per worker are parsed
+                   ahead of the month being yielded.
+        data_dir -- directory holding the monthly files
+
+    Yields: tuple of the path of the monthly file and the list of games
+    in that month (see load_month).
+    """
+    file_list = month_files(data_dir)
+    if workers > 1 and len(file_list) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from zip(file_list, pool_map(
+                pool, load_month, file_list,
+                ahead=workers * MONTHS_AHEAD))
+        return
     for jfile in file_list:
-        month_dict = {}
-        month_list = []
-        with open(jfile, 'r') as jfile_fd:
-            glist = json.load(jfile_fd)
-            for entry in glist[GAMES]:
-                mkey, mdata = restruct(entry)
-                month_dict[mkey] = mdata
-        klist = sorted(month_dict.keys())
-        for indx in klist:
-            month_list.append(month_dict[indx])
-        return_list.extend(month_list)
-    return return_list
+        yield jfile, load_month(jfile)
+
+
+def iter_games(workers=1, data_dir=DATA_PATH):
+    """
+    Generator over all games played, in the same order as the list
+    returned by get_all_game_data.
+
+    Args:
+        workers -- number of processes used to parse monthly files
+        data_dir -- directory holding the monthly files
+    """
+    for _, month_list in iter_months(workers, data_dir):
+        yield from month_list
 
 
+def get_all_game_data(workers=1, data_dir=DATA_PATH):
+    """
+    Return list of all games played (each entry is a dictionary)
+    representing data
+
+    Args:
+        workers -- number of processes used to parse monthly files
+        data_dir -- directory holding the monthly files
+    """
+    return list(iter_games(workers, data_dir))
+
+
+def new_extract_result(player):
+    """
+    Return the initial value of the dictionary returned by extract_data
+    (see extract_data for a description of the fields), before any
+    games have been classified.
+
+    Args:
+        player -- player name
+    """
+    outres = {}
+    outres[O_PLAYER] = player
+    outres[O_DRAW_TYPES] = {}
+    outres[O_WININFO] = {}
+    outres[O_MYWINS] = []
+    outres[O_WHITE] = []
+    outres[O_WLASTMV] = []
+    outres[O_DRAWS] = []
+    outres[O_ALL_DATA] = []
+    outres[O_TIMES] = array('q')
+    outres[O_INDEX] = {}
+    for category in [O_MYWINS, O_DRAWS, O_WHITE, O_WLASTMV]:
+        outres[O_INDEX][category] = set()
+    return outres
+
+
+def add_to_category(outres, category, glist, count):
+    """
+    Record game number count in the list glist and in the O_INDEX set
+    for category.
+    """
+    glist.append(count)
+    outres[O_INDEX].setdefault(category, set()).add(count)
+
+
+@timed("classify")
+def classify_game(outres, count, game):
+    """
+    Add one game to the category bookkeeping of extract_data.  Games
+    must be passed in order, so that count is the game number.
+
+    Args:
+        outres -- dictionary being built (see new_extract_result)
+        count -- game number
+        game -- game data
+    """
+    if game.white_name == outres[O_PLAYER]:
+        add_to_category(outres, O_WHITE, outres[O_WHITE], count)
+    result = game[TERMINATION]
+    tomove = game[CURRENT_POSITION].split(' ')[1]
+    if tomove == 'b':
+        add_to_category(outres, O_WLASTMV, outres[O_WLASTMV], count)
+    if DRAWN in result:
+        add_to_category(outres, result,
+                        outres[O_DRAW_TYPES].setdefault(result, []), count)
+        add_to_category(outres, O_DRAWS, outres[O_DRAWS], count)
+    else:
+        if result.startswith(outres[O_PLAYER] + " "):
+            add_to_category(outres, O_MYWINS, outres[O_MYWINS], count)
+        skip_pl = result.find(" ")
+        np_result = result[skip_pl + 1:]
+        add_to_category(outres, np_result,
+                        outres[O_WININFO].setdefault(np_result, []), count)
+
+
+@timed("extract_data")
 def extract_data():
     """
     Main data extraction routine.  Returns a dictionary containing
     the following entries:
 
     O_PLAYER -- player name
+    O_CHANGED -- names of the monthly files that copy_files found to
+               be new or modified on this run.
     O_DRAW_TYPES -- a dictionary indexed by reasons for a draw.
                   The value is a matching list of game numbers
     O_WININFO -- a dictionary indexed by type of win (checkmate,
@@ -104,33 +314,129 @@ def extract_data():
     O_DRAWS -- a list of drawn games.
     O_ALL_DATA -- a list of full games.  The index of a specific game
                 is its game number
+    O_INDEX -- a dictionary of sets of game numbers, for fast membership
+               tests and set queries (see select_games).  The keys are
+               O_MYWINS, O_DRAWS, O_WHITE, O_WLASTMV and every key of
+               O_DRAW_TYPES and O_WININFO.
+    O_WORKERS -- number of worker processes set in chess.ini (1 if not
+               set).  Reports use it for their own process pools.
+    O_TIMES -- array of the time (in seconds) that each game ended,
+               indexed by game number.  Games are in the order they
+               ended, so this is sorted and can be searched with bisect
+               (see window_games).
+    O_DATA_PATH -- directory holding the monthly files (the datadir
+               setting in chess.ini, or DATA_PATH if not set).
+
+    Games are classified as they are streamed from the monthly files.
+    If chess.ini sets workers in the DEFAULT section, monthly files are
+    parsed by a process pool of that size.
     """
-    pinfo = copy_files(configparser.ConfigParser())
-    all_data = get_all_game_data()
-    outres = {}
-    outres[O_PLAYER] = pinfo[DEFAULT][USER]
-    outres[O_DRAW_TYPES] = {}
-    outres[O_WININFO] = {}
-    outres[O_MYWINS] = []
-    outres[O_WHITE] = []
-    outres[O_WLASTMV] = []
-    for count, game in enumerate(all_data):
-        if game[WHITE][USERNAME] == outres[O_PLAYER]:
-            outres[O_WHITE].append(count)
-        result = game[TERMINATION]
-        tomove = game[CURRENT_POSITION].split(' ')[1]
-        if tomove == 'b':
-            outres[O_WLASTMV].append(count)
-        if DRAWN in result:
-            outres[O_DRAW_TYPES].setdefault(result, []).append(count)
-        else:
-            if result.startswith(pinfo[DEFAULT][USER] + " "):
-                outres[O_MYWINS].append(count)
-            skip_pl = result.find(" ")
-            np_result = result[skip_pl + 1:]
-            outres[O_WININFO].setdefault(np_result, []).append(count)
-    outres[O_DRAWS] = []
-    for tdraws in outres[O_DRAW_TYPES]:
-        outres[O_DRAWS].extend(outres[O_DRAW_TYPES][tdraws])
-    outres[O_ALL_DATA] = all_data
+    pinfo = configparser.ConfigParser()
+    changed = copy_files(pinfo)
+    outres = new_extract_result(pinfo[DEFAULT][USER])
+    outres[O_CHANGED] = changed
+    workers = pinfo[DEFAULT].getint(WORKERS, 1)
+    outres[O_WORKERS] = workers
+    outres[O_DATA_PATH] = data_path(pinfo)
+    for count, game in enumerate(iter_games(workers, outres[O_DATA_PATH])):
+        classify_game(outres, count, game)
+        outres[O_ALL_DATA].append(game)
+        outres[O_TIMES].append(game_timestamp(game))
+    tally("extract_data", games=len(outres[O_ALL_DATA]))
     return outres
+
+
+def to_timestamp(when):
+    """
+    Convert when (a datetime, a date, or a number of seconds) into
+    seconds, using the same local time convention as game_timestamp.
+    """
+    if isinstance(when, datetime.datetime):
+        return int(when.timestamp())
+    if isinstance(when, datetime.date):
+        return int(datetime.datetime(when.year, when.month,
+                                     when.day).timestamp())
+    return int(when)
+
+
+def last_days(days, now=None):
+    """
+    Return the window (see window_games) covering the days before now
+    (the current time if not set).
+    """
+    if now is None:
+        now = datetime.datetime.now()
+    return to_timestamp(now) - days * 24 * 3600, None
+
+
+def window_games(data, window=None):
+    """
+    Find the games that ended inside a time window.
+
+    Args:
+        data -- value returned by extract_data
+        window -- tuple of start and end times (each a datetime, date or
+                  number of seconds, see to_timestamp).  A game is in
+                  the window if it ended at or after start and before
+                  end.  Either one may be None to leave that side open.
+                  Every game is in a window of None.  For example, the
+                  games of 2020 are in (date(2020, 1, 1), date(2021, 1, 1)).
+
+    Returns: range of game numbers.  The range can be passed to
+    select_games as a category.
+    """
+    times = data[O_TIMES]
+    if window is None:
+        return range(len(times))
+    start, end = window
+    first = 0 if start is None else bisect_left(times, to_timestamp(start))
+    last = len(times) if end is None else bisect_left(times,
+                                                      to_timestamp(end))
+    return range(first, max(first, last))
+
+
+def get_category(data, category):
+    """
+    Return the set of game numbers for a category.  category may be a
+    key of O_INDEX (an unknown key matches no games) or may already be
+    a set or list of game numbers.
+    """
+    if isinstance(category, str):
+        return data[O_INDEX].get(category, set())
+    return set(category)
+
+
+def select_games(data, include=(), exclude=()):
+    """
+    Find games that are in every include category and in no exclude
+    category.  For example, draws as black in the Sicilian are:
+
+        select_games(data, [O_DRAWS, sicilian_games], [O_WHITE])
+
+    Args:
+        data -- value returned by extract_data
+        include -- list of categories (see get_category).  If empty, all
+                   games are included.
+        exclude -- list of categories to remove
+
+    Returns: sorted list of game numbers
+    """
+    if include:
+        games = set.intersection(
+            *[get_category(data, category) for category in include])
+    else:
+        games = set(range(len(data[O_ALL_DATA])))
+    for category in exclude:
+        games -= get_category(data, category)
+    return sorted(games)
+
+
+def any_games(data, categories):
+    """
+    Return a sorted list of the game numbers in at least one of the
+    categories (see get_category).
+    """
+    games = set()
+    for category in categories:
+        games |= get_category(data, category)
+    return sorted(games)
@@ -0,0 +1,318 @@
+"""
+Fetch a player's monthly game archives from chess.com.
+
+Each month is read from ARCHIVE_URL/<player>/games/<YYYY>/<MM> and
+written to yYYYYmMM.json (through a temporary file, so that a partly
+written month is never seen).  The ETag and Last-Modified headers sent
+with each archive are saved in FETCH_STATE in the same directory and
+sent back on the next run, so a month that has not changed is answered
+with 304 Not Modified and is not downloaded or rewritten.
+
+Requests are made by an asyncio loop with at most CONNECTIONS requests
+in flight.  Requests that fail with a connection error, a timeout, 429
+or a 5xx status are retried with exponential backoff (or after the time
+given by a Retry-After header).
+
+The player and directories come from chess.ini: files are written to
+fromdir if it is set (so that copy_files picks them up) and to datadir
+(DATA_PATH by default) otherwise.  An archiveurl setting replaces
+ARCHIVE_URL, which lets a local server stand in for chess.com.
+
+Run with:
+    python -m chess_career.fetch_games [first month] [last month]
+Months are given as YYYY-MM.  By default last December and every month
+of the current year are fetched.
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import configparser
+import datetime
+import json
+import os
+import random
+import sys
+import urllib.error
+import urllib.request
+from chess_career.extract_game import USER
+from chess_career.io_module import data_path, DEFAULT, FROMDIR, JSON
+from chess_career.profiling import tally, timed
+ARCHIVE_URL = "https://api.chess.com/pub/player"
+ARCHIVEURL = "archiveurl"
+USER_AGENT = "chess_career-fetch_games"
+FETCH_STATE = "fetch_state.json"
+F_ETAG = "etag"
+F_MODIFIED = "last_modified"
+CONNECTIONS = 4
+RETRIES = 4
+BACKOFF = 1.0
+TIMEOUT = 30
+RETRY_CODES = (429, 500, 502, 503, 504)
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+MISSING = "missing"
+FAILED = "failed"
+
+
+def month_file_name(year, month):
+    """
+    Return the name of the monthly file for a year and month.
+    """
+    return "y{}m{:02d}{}".format(year, month, JSON)
+
+
+def parse_month(text):
+    """
+    Convert a YYYY-MM string into a (year, month) tuple.
+    """
+    year, month = text.split("-")
+    if not 1 <= int(month) <= 12:
+        raise ValueError("bad month: {}".format(text))
+    return int(year), int(month)
+
+
+def month_range(first, last):
+    """
+    Return the list of (year, month) tuples from first to last inclusive.
+    """
+    months = []
+    year, month = first
+    while (year, month) <= last:
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def default_months(today=None):
+    """
+    Return last December and every month of the current year up to
+    today.
+    """
+    today = today or datetime.date.today()
+    return month_range((today.year - 1, 12), (today.year, today.month))
+
+
+def archive_url(base_url, player, year, month):
+    """
+    Return the url of one month of a player's games.
+    """
+    return "{}/{}/games/{}/{:02d}".format(base_url.rstrip("/"),
+                                          player.lower(), year, month)
+
+
+def read_fetch_state(todir):
+    """
+    Read the fetch state kept in todir.  Returns a dictionary indexed by
+    file name.  Each value is a dictionary of the ETag and Last-Modified
+    headers sent with the last copy of that month.
+    """
+    try:
+        with open(os.path.join(todir, FETCH_STATE), 'r') as iofd:
+            return json.load(iofd)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_fetch_state(todir, state):
+    """
+    Save the fetch state in todir.
+    """
+    sfile = os.path.join(todir, FETCH_STATE)
+    with open(sfile + ".tmp", 'w') as iofd:
+        json.dump(state, iofd, indent=1, sort_keys=True)
+    os.replace(sfile + ".tmp", sfile)
+
+
+def conditional_headers(entry):
+    """
+    Return the request headers for a month, given its fetch state entry.
+    """
+    headers = {"User-Agent": USER_AGENT, "Accept": "application/json"}
+    if entry.get(F_ETAG):
+        headers["If-None-Match"] = entry[F_ETAG]
+    if entry.get(F_MODIFIED):
+        headers["If-Modified-Since"] = entry[F_MODIFIED]
+    return headers
+
+
+def http_get(url, headers, timeout=TIMEOUT):
+    """
+    Make one GET request.  Runs in a worker thread.
+
+    Returns: tuple of the status code, the response headers and the body
+    (empty unless the status is 200).  Connection errors and timeouts
+    are returned as status 0.
+    """
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as err:
+        return err.code, err.headers or {}, b""
+    except (urllib.error.URLError, OSError):
+        return 0, {}, b""
+
+
+def retry_delay(attempt, headers, backoff):
+    """
+    Return the number of seconds to wait before retrying a request: the
+    Retry-After header if the server sent one, otherwise backoff doubled
+    for every earlier attempt, plus a little jitter.
+    """
+    retry_after = headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return int(retry_after)
+    return backoff * (2 ** attempt) * (1 + random.random() / 4)
+
+
+def write_month(mfile, body):
+    """
+    Write a monthly file through a temporary file.  Nothing is written if
+    the file already holds body, so its modification time is unchanged.
+
+    Returns: True if the file was written
+    """
+    try:
+        with open(mfile, 'rb') as iofd:
+            if iofd.read() == body:
+                return False
+    except OSError:
+        pass
+    with open(mfile + ".tmp", 'wb') as iofd:
+        iofd.write(body)
+    os.replace(mfile + ".tmp", mfile)
+    tally("fetch_games", bytes_written=len(body))
+    return True
+
+
+def has_games(body):
+    """
+    True if body is an archive with at least one game in it.
+    """
+    try:
+        return bool(json.loads(body).get("games"))
+    except (ValueError, AttributeError):
+        return False
+
+
+async def fetch_month(fetcher, url, mfile, entry):
+    """
+    Fetch one month, retrying on failures.
+
+    Args:
+        fetcher -- dictionary of the loop, executor, semaphore and retry
+                   settings shared by every month (see fetch_months)
+        url -- url of the month's archive
+        mfile -- path of the monthly file
+        entry -- fetch state entry of the month (updated in place)
+
+    Returns: CHANGED, UNCHANGED, MISSING or FAILED
+    """
+    headers = conditional_headers(entry if os.path.exists(mfile) else {})
+    for attempt in range(fetcher["retries"] + 1):
+        if attempt:
+            await asyncio.sleep(retry_delay(attempt - 1, rheaders,
+                                            fetcher["backoff"]))
+        async with fetcher["slots"]:
+            status, rheaders, body = await fetcher["loop"].run_in_executor(
+                fetcher["executor"], http_get, url, headers)
+        if status == 304:
+            return UNCHANGED
+        if status == 404:
+            return MISSING
+        if status == 200:
+            tally("fetch_games", bytes_read=len(body))
+            if not has_games(body):
+                return MISSING
+            entry.clear()
+            if rheaders.get("ETag"):
+                entry[F_ETAG] = rheaders["ETag"]
+            if rheaders.get("Last-Modified"):
+                entry[F_MODIFIED] = rheaders["Last-Modified"]
+            return CHANGED if write_month(mfile, body) else UNCHANGED
+        if status and status not in RETRY_CODES:
+            return FAILED
+    return FAILED
+
+
+async def fetch_months(player, months, todir, base_url, connections,
+                       retries, backoff):
+    """
+    Fetch a list of months concurrently (see fetch_archives).
+    """
+    state = read_fetch_state(todir)
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        fetcher = {
+            "loop": asyncio.get_running_loop(),
+            "executor": executor,
+            "slots": asyncio.Semaphore(connections),
+            "retries": retries,
+            "backoff": backoff
+        }
+        names = [month_file_name(year, month) for year, month in months]
+        outcomes = await asyncio.gather(*[
+            fetch_month(fetcher, archive_url(base_url, player, year, month),
+                        os.path.join(todir, name),
+                        state.setdefault(name, {}))
+            for (year, month), name in zip(months, names)])
+    write_fetch_state(todir, {name: entry for name, entry in state.items()
+                              if entry})
+    return dict(zip(names, outcomes))
+
+
+@timed("fetch_games")
+def fetch_archives(player, months, todir, base_url=ARCHIVE_URL,
+                   connections=CONNECTIONS, retries=RETRIES,
+                   backoff=BACKOFF):
+    """
+    Fetch a player's monthly archives into todir, downloading only the
+    months that changed since the last run.
+
+    Args:
+        player -- chess.com user name
+        months -- list of (year, month) tuples
+        todir -- directory the yYYYYmMM.json files are written to
+        base_url -- url that the player archive urls start with
+        connections -- maximum number of requests in flight
+        retries -- number of times a failed request is retried
+        backoff -- seconds waited before the first retry
+
+    Returns: dictionary indexed by file name of CHANGED, UNCHANGED,
+    MISSING (no games that month) or FAILED
+    """
+    os.makedirs(todir, exist_ok=True)
+    return asyncio.run(fetch_months(player, months, todir, base_url,
+                                    connections, retries, backoff))
+
+
+def main():
+    """
+    Fetch the months given on the command line for the chess.ini user.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("first", nargs="?", type=parse_month,
+                        help="first month (YYYY-MM)")
+    parser.add_argument("last", nargs="?", type=parse_month,
+                        help="last month (YYYY-MM, first month if not "
+                        "given)")
+    parser.add_argument("--connections", type=int, default=CONNECTIONS)
+    parser.add_argument("--retries", type=int, default=RETRIES)
+    args = parser.parse_args()
+    conf_info = configparser.ConfigParser()
+    conf_info.read("chess.ini")
+    settings = conf_info[DEFAULT]
+    todir = settings.get(FROMDIR, data_path(conf_info))
+    months = default_months()
+    if args.first:
+        months = month_range(args.first, args.last or args.first)
+    outcomes = fetch_archives(settings[USER], months, todir,
+                              settings.get(ARCHIVEURL, ARCHIVE_URL),
+                              args.connections, args.retries)
+    for name, outcome in sorted(outcomes.items()):
+        print("{}: {}".format(name, outcome))
+    if FAILED in outcomes.values():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Compact storage of a single game.
+
+A GameRecord keeps the tags that reports use in slots (with repeated
+values such as user names interned) and decodes everything else from
+the pgn text only when it is asked for.  It can be indexed like the
+game dictionaries that it replaces.
+"""
+import re
+import sys
+from chess_career.io_module import BLACK, WHITE, DATE
+from chess_career.utilities import GAMEREC, CURRENT_POSITION, ECOURL
+ENDDATE = "EndDate"
+ENDTIME = "EndTime"
+LINK = "Link"
+PGN = "pgn"
+TERMINATION = "Termination"
+TIMECONTROL = "TimeControl"
+USERNAME = "username"
+HEADER_PATTERN = re.compile(r'^\[(\S+) "(.*)"\]\s*$', re.MULTILINE)
+SLOT_TAGS = {
+    DATE: "date",
+    ENDDATE: "end_date",
+    ENDTIME: "end_time",
+    TERMINATION: "termination",
+    CURRENT_POSITION: "position",
+    ECOURL: "ecourl",
+    TIMECONTROL: "time_control",
+    LINK: "link"
+}
+INTERNED_TAGS = [DATE, ENDDATE, TERMINATION, ECOURL, TIMECONTROL]
+INTERNED_SLOTS = frozenset(["white_name", "black_name"] +
+                           [SLOT_TAGS[tag] for tag in INTERNED_TAGS])
+
+
+def parse_headers(pgn, tags=None):
+    """
+    Extract the tag pairs from the header of a pgn string.  Only the
+    header section (the text before the first blank line) is scanned.
+
+    Args:
+        pgn -- pgn text of a game
+        tags -- if set, a list of the tags wanted.  Other tags are dropped.
+
+    Returns: dictionary of tag values indexed by tag name
+    """
+    hend = pgn.find("\n\n")
+    if hend < 0:
+        hend = len(pgn)
+    headers = dict(HEADER_PATTERN.findall(pgn, 0, hend))
+    if tags is None:
+        return headers
+    return {tag: headers[tag] for tag in tags if tag in headers}
+
+
+def movetext(pgn):
+    """
+    Return the move section of a pgn string (the text after the last
+    blank line).  Callers that do not need the moves can skip this.
+    """
+    mstart = pgn.rfind("\n\n")
+    if mstart < 0:
+        return pgn.strip()
+    return pgn[mstart + 2:].strip()
+
+
+def intern_value(value):
+    """
+    Intern a string so that equal values share one object.  None is
+    returned unchanged.
+    """
+    if value is None:
+        return None
+    return sys.intern(value)
+
+
+class GameRecord():
+    """
+    Information for one game.
+
+    entry is the game object from a chess.com monthly archive.
+
+    Indexing a GameRecord with a pgn tag name returns the tag value.
+    Indexing with GAMEREC returns the move section of the pgn, and
+    indexing with WHITE or BLACK returns a new dictionary holding that
+    player's USERNAME, as the archive entry did.  Missing tags raise
+    KeyError, as they would in a dictionary.
+
+    Code that reads the players of every game should use the white_name
+    and black_name attributes, which return the interned user names
+    without building a dictionary.
+    """
+    __slots__ = (
+        "pgn", "white_name", "black_name", "date", "end_date", "end_time",
+        "termination", "position", "ecourl", "time_control", "link"
+    )
+
+    def __init__(self, entry):
+        self.pgn = entry[PGN]
+        self.white_name = sys.intern(entry[WHITE][USERNAME])
+        self.black_name = sys.intern(entry[BLACK][USERNAME])
+        headers = parse_headers(self.pgn, list(SLOT_TAGS))
+        for tag, slot in SLOT_TAGS.items():
+            value = headers.get(tag)
+            if tag in INTERNED_TAGS:
+                value = intern_value(value)
+            setattr(self, slot, value)
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            if slot in INTERNED_SLOTS:
+                value = intern_value(value)
+            setattr(self, slot, value)
+
+    def __getitem__(self, key):
+        if key in SLOT_TAGS:
+            value = getattr(self, SLOT_TAGS[key])
+            if value is None:
+                raise KeyError(key)
+            return value
+        if key == GAMEREC:
+            return movetext(self.pgn)
+        if key == WHITE:
+            return {USERNAME: self.white_name}
+        if key == BLACK:
+            return {USERNAME: self.black_name}
+        return parse_headers(self.pgn, [key])[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        """
+        Return the value for key, or default if the game does not have it.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def headers(self):
+        """
+        Return a dictionary of all the pgn tags of this game.
+        """
+        return parse_headers(self.pgn)
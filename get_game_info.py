@@ -8,22 +8,28 @@ from datetime import datetime
 from chess_career.extract_game import (
     extract_data,
     GAMEREC,
-    O_ALL_DATA,
-    USERNAME
+    O_ALL_DATA
 )
+from chess_career.game_record import LINK, ENDTIME
 from chess_career.io_module import (
     WHITE,
     BLACK,
     DATE
 )
-from chess_career.io_module import write_game_page, NUMBER, OPENING
-from chess_career.openings import ECOURL
+from chess_career.io_module import write_game_page, NUMBER, OPENING, GAME_ID
+from chess_career.io_module import (
+    game_page_file,
+    render_game_page,
+    write_changed_pages
+)
+from chess_career.profiling import timed
+from chess_career.utilities import ECOURL
 
 
-def generate_game_page(info_packet):
+def game_move_rows(info_packet):
     """
-    Extracts the record from a game packet, formats the moves into
-    rows of cells, and calls write_game_page to produce the file.
+    Format the moves in a game packet into rows of cells.  Each row
+    holds a move number, white's move and black's move.
 
     Parameters:
         info_packet -- dict of game information/metadata
@@ -40,7 +46,32 @@ def generate_game_page(info_packet):
             this_mv = []
     if len(this_mv) > 0:
         move_data.append(this_mv)
-    write_game_page(info_packet, move_data)
+    return move_data
+
+
+def generate_game_page(info_packet):
+    """
+    Extracts the record from a game packet, formats the moves into
+    rows of cells, and calls write_game_page to produce the file.
+
+    Parameters:
+        info_packet -- dict of game information/metadata
+    """
+    write_game_page(info_packet, game_move_rows(info_packet))
+
+
+def game_id(game_info):
+    """
+    Return an identifier for a game that does not change when other
+    games are added.  This is taken from the game's Link tag
+    (https://www.chess.com/game/live/12345 becomes live-12345).  Games
+    without a link are identified by end date, end time and players.
+    """
+    if LINK in game_info:
+        return "-".join(game_info[LINK].rstrip("/").split("/")[-2:])
+    parts = [game_info[DATE], game_info[ENDTIME], game_info.white_name,
+             game_info.black_name]
+    return "".join([x for x in "-".join(parts) if x.isalnum() or x in "-_"])
 
 
 def refmt_date(in_date):
@@ -80,22 +111,54 @@ def move_fix(move_list):
     return move_list
 
 
-def write_game_info():
+def game_info_packets(game_data):
     """
-    Loop through all games and produce a page for each game.
+    Generator over the info packets of all games that have an opening.
+
+    Args:
+        game_data -- value returned by extract_data
     """
-    game_data = extract_data()
     for count, game_info in enumerate(game_data[O_ALL_DATA]):
         info_packet = {}
         info_packet[NUMBER] = count
-        info_packet[WHITE] = game_info[WHITE][USERNAME]
-        info_packet[BLACK] = game_info[BLACK][USERNAME]
+        info_packet[GAME_ID] = game_id(game_info)
+        info_packet[WHITE] = game_info.white_name
+        info_packet[BLACK] = game_info.black_name
         info_packet[DATE] = refmt_date(game_info[DATE])
         if ECOURL not in game_info:
             continue
         info_packet[OPENING] = game_info[ECOURL]
         info_packet[GAMEREC] = move_fix(game_info[GAMEREC])
-        generate_game_page(info_packet)
+        yield info_packet
+
+
+def game_pages(game_data):
+    """
+    Generator over (game id, file name, html text) tuples for the page
+    of each game.
+    """
+    for info_packet in game_info_packets(game_data):
+        text = render_game_page(info_packet, game_move_rows(info_packet))
+        yield info_packet[GAME_ID], game_page_file(info_packet), text
+
+
+@timed("write_game_info")
+def write_game_info(game_data=None):
+    """
+    Loop through all games and produce a page for each game.
+
+    Pages are named by game id, and only pages that are new or whose
+    contents changed since the last run are written.  Pages of games
+    that are gone are deleted.
+
+    game_data is the value returned by extract_data (extract_data is
+    called if not set).
+    """
+    if game_data is None:
+        game_data = extract_data()
+    written, unchanged, removed = write_changed_pages(game_pages(game_data))
+    print("{} game pages written, {} unchanged, {} removed".format(
+        written, unchanged, removed))
 
 
 if __name__ == "__main__":
@@ -1,35 +1,170 @@
 """
 I/O Modules used by chess tools
 """
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import html
+import io
+import json
 import os
 import shutil
+from chess_career.profiling import tally, timed
 DATA_PATH = os.path.join("..", "..", "data")
 DEFAULT = "DEFAULT"
+DATADIR = "datadir"
 FROMDIR = "fromdir"
+SYNC = "sync"
 JSON = ".json"
+MANIFEST = "manifest.json"
+M_SIZE = "size"
+M_MTIME = "mtime"
+M_HASH = "sha256"
+TEMPLATE_CACHE = {}
+GAMES_DIR = "games"
+PAGE_BATCH = 100
+PAGE_THREADS = 4
 NUMBER = "number"
+GAME_ID = "game_id"
 OPENING = "opening"
 BLACK = "black"
 WHITE = "white"
 DATE = "Date"
 
 
+def is_month_file(file_name):
+    """
+    True if file_name is one of the yYYYYmMM.json monthly game files.
+    """
+    return file_name.startswith('y') and file_name.endswith(JSON)
+
+
+def file_digest(file_name):
+    """
+    Return the sha256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as iofd:
+        for block in iter(lambda: iofd.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(todir):
+    """
+    Read the sync manifest kept in todir.  Returns a dictionary indexed
+    by file name.  Each value is a dictionary of the size, modification
+    time and content hash of the file when it was last copied.
+    """
+    try:
+        with open(os.path.join(todir, MANIFEST), 'r') as iofd:
+            return json.load(iofd)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(todir, manifest):
+    """
+    Save the sync manifest in todir.
+    """
+    mfile = os.path.join(todir, MANIFEST)
+    with open(mfile + ".tmp", 'w') as iofd:
+        json.dump(manifest, iofd, indent=1, sort_keys=True)
+    os.replace(mfile + ".tmp", mfile)
+
+
+def sync_files(fromdir, todir=DATA_PATH):
+    """
+    Copy the monthly files in fromdir that are new or modified into todir.
+
+    A file whose size and modification time match the manifest entry is
+    skipped without being read.  Otherwise its content hash is compared
+    with the manifest, so files that were only touched are not copied.
+
+    Args:
+        fromdir -- directory that the monthly files are fetched into
+        todir -- data directory that the monthly files are copied to
+
+    Returns: sorted list of the names of the files that were copied.
+    """
+    manifest = read_manifest(todir)
+    changed = []
+    for file_name in sorted(os.listdir(fromdir)):
+        if not is_month_file(file_name):
+            continue
+        src_file = os.path.join(fromdir, file_name)
+        fstat = os.stat(src_file)
+        entry = manifest.get(file_name, {})
+        present = os.path.exists(os.path.join(todir, file_name))
+        if (present and entry.get(M_SIZE) == fstat.st_size and
+                entry.get(M_MTIME) == fstat.st_mtime_ns):
+            continue
+        new_entry = {
+            M_SIZE: fstat.st_size,
+            M_MTIME: fstat.st_mtime_ns,
+            M_HASH: file_digest(src_file)
+        }
+        manifest[file_name] = new_entry
+        if present and entry.get(M_HASH) == new_entry[M_HASH]:
+            continue
+        shutil.copy2(src_file, todir)
+        tally("copy_files", bytes_written=fstat.st_size)
+        changed.append(file_name)
+    write_manifest(todir, manifest)
+    return changed
+
+
+def data_path(conf_info):
+    """
+    Return the data directory set by the datadir field of the DEFAULT
+    section of an ini file (DATA_PATH if it is not set).
+    """
+    return conf_info[DEFAULT].get(DATADIR, DATA_PATH)
+
+
+@timed("copy_files")
 def copy_files(conf_info):
     """
     Copy files from fromfile field read from an ini file.
 
+    Unless sync is set to no in the ini file, only new or modified files
+    are copied.  Files are copied to the datadir directory if the ini
+    file sets one.
+
     Args:
-        conf_info -- configparser object
+        conf_info -- configparser object.  chess.ini is read into it.
+
+    Returns: sorted list of the names of the files that were copied.
     """
     conf_info.read("chess.ini")
-    if FROMDIR in conf_info[DEFAULT]:
-        for file_name in os.listdir(conf_info[DEFAULT][FROMDIR]):
-            if file_name.startswith('y') and file_name.endswith(JSON):
-                shutil.copy(
-                    os.sep.join([conf_info[DEFAULT][FROMDIR], file_name]),
-                    DATA_PATH
-                )
-    return conf_info
+    if FROMDIR not in conf_info[DEFAULT]:
+        return []
+    fromdir = conf_info[DEFAULT][FROMDIR]
+    todir = data_path(conf_info)
+    if conf_info[DEFAULT].getboolean(SYNC, True):
+        return sync_files(fromdir, todir)
+    changed = []
+    for file_name in sorted(os.listdir(fromdir)):
+        if is_month_file(file_name):
+            shutil.copy2(os.sep.join([fromdir, file_name]), todir)
+            changed.append(file_name)
+    return changed
+
+
+def table_row(in_line):
+    """
+    Format one line of a table into html code.  Cell values are html
+    escaped.
+
+    Args:
+        in_line -- list of cell values
+
+    Returns:
+        String of HTML for that row of the table
+    """
+    wrap_parts = []
+    for part in in_line:
+        wrap_parts.append("".join(['<td>', html.escape(part, False), '</td>']))
+    return "".join(["<tr>", "".join(wrap_parts), "</tr>"])
 
 
 def format_table(array_of_entries):
@@ -42,14 +177,25 @@ def format_table(array_of_entries):
     Returns:
         String of HTML lines that represent rows in the table.
     """
-    out_lines = []
+    return "".join([table_row(in_line) for in_line in array_of_entries])
+
+
+def write_table(iofd, header, array_of_entries, trailer):
+    """
+    Write a page containing a table one row at a time, so that the
+    whole page is never held in memory.
+
+    Args:
+        iofd -- file (or any object with a write method) to write to
+        header -- html text written before the table rows
+        array_of_entries -- list (or iterator) of lines.  Each line is a
+                            list of cell values.
+        trailer -- html text written after the table rows
+    """
+    iofd.write(header)
     for in_line in array_of_entries:
-        wrap_parts = []
-        for part in in_line:
-            wrap_parts.append("".join(['<td>', part, '</td>']))
-        nline = "".join(["<tr>", "".join(wrap_parts), "</tr>"])
-        out_lines.append(nline)
-    return "".join(out_lines)
+        iofd.write(table_row(in_line))
+    iofd.write(trailer)
 
 
 def assemble_table_rows(template_file, array_of_entries):
@@ -71,7 +217,9 @@ def assemble_table_rows(template_file, array_of_entries):
     return ''.join([header, block_of_data, trailer])
 
 
-def generate_table_report(template_file, array_of_entries, specific=""):
+@timed("write_reports")
+def generate_table_report(template_file, array_of_entries, specific="",
+                          report=None):
     """
     Generate a page display of a table
 
@@ -84,23 +232,45 @@ def generate_table_report(template_file, array_of_entries, specific=""):
                             values ( table cells).
         specific -- Name of the html_file, if specified. Text also gets
                     inserted in header instead of "General".
+        report -- Name of the html file (without the suffix), for reports
+                  that share another report's template.
 
     Output:
         html file displaying the table is written to the reports directory
     """
-    output = assemble_table_rows(template_file, array_of_entries)
+    header, trailer = get_header_trailer(template_file)
     ofilen = template_file
     if specific:
-        output = output.replace("General", specific)
+        header = header.replace("General", specific)
+        trailer = trailer.replace("General", specific)
         ofilen = ofilen.replace("general", specific)
+    if report:
+        ofilen = report
     ofile = os.path.join("reports", ofilen + ".html")
     with open(ofile, 'w') as iofd:
-        iofd.write(output)
+        write_table(iofd, header, array_of_entries, trailer)
+        tally("write_reports", bytes_written=iofd.tell())
 
 
 def get_header_trailer(template_file):
     """
-    Split up a template file into the first half and second half
+    Split up a template file into the first half and second half.
+    Each template file is only read once per process.
+
+    Input:
+        template_file -- text file of templated html code
+
+    Returns: front text of html page, back text of html page
+    """
+    if template_file not in TEMPLATE_CACHE:
+        TEMPLATE_CACHE[template_file] = read_template(template_file)
+    return TEMPLATE_CACHE[template_file]
+
+
+@timed("read_templates")
+def read_template(template_file):
+    """
+    Read a template file and split it at the DATA_GOES_HERE line.
 
     Input:
         template_file -- text file of templated html code
@@ -113,6 +283,7 @@ def get_header_trailer(template_file):
         tfile = "{}{}{}.txt".format("templates", os.sep, template_file)
     with open(tfile, 'r') as iofd:
         html_data = iofd.read()
+    tally("read_templates", bytes_read=len(html_data))
     brk_loc = html_data.find("DATA_GOES_HERE")
     header = html_data[0:brk_loc]
     trailer = html_data[brk_loc:]
@@ -121,6 +292,52 @@ def get_header_trailer(template_file):
     return header, trailer
 
 
+def fill_game_fields(text, info_packet):
+    """
+    Replace the GAME_* fields of the game page template with the values
+    for one game.  GAME_NUMBER is filled with the stable game id if
+    info_packet has one, so that a page does not change when games are
+    added before it.
+    """
+    topening = info_packet[OPENING].split("/")[-1]
+    text = text.replace("GAME_NUMBER", str(
+        info_packet.get(GAME_ID, info_packet[NUMBER] + 1)))
+    text = text.replace("GAME_DATE", info_packet[DATE])
+    text = text.replace("GAME_OPENING", topening)
+    text = text.replace("GAME_WHITE", info_packet[WHITE])
+    return text.replace("GAME_BLACK", info_packet[BLACK])
+
+
+def render_game_page(info_packet, tbl_info):
+    """
+    Return the html text of a game page.
+
+    Parameters:
+        info_packet -- dict of information about the game.
+                    (opening, date, number, players)
+        tbl_info -- move information going into the table (see
+                    write_game_page)
+    """
+    header, trailer = get_header_trailer("game_page")
+    out_text = io.StringIO()
+    write_table(out_text, fill_game_fields(header, info_packet), tbl_info,
+                fill_game_fields(trailer, info_packet))
+    return out_text.getvalue()
+
+
+def game_page_file(info_packet):
+    """
+    Return the name of the file holding a game page.  Pages are named
+    after the stable game id if info_packet has one, and after the game
+    number otherwise.
+    """
+    if GAME_ID in info_packet:
+        ofilen = "".join(['game_', info_packet[GAME_ID]])
+    else:
+        ofilen = "".join(['game', str(info_packet[NUMBER] + 1).zfill(5)])
+    return os.path.join(GAMES_DIR, ofilen + ".html")
+
+
 def write_game_page(info_packet, tbl_info):
     """
     Create a game page in the game subdiretory
@@ -134,16 +351,84 @@ def write_game_page(info_packet, tbl_info):
                     a list of cells.
     """
     print(info_packet, tbl_info)
-    template_file = "game_page"
-    output = assemble_table_rows(template_file, tbl_info)
-    gnumber = info_packet[NUMBER] + 1
-    ofilen = "".join(['game', str(gnumber).zfill(5)])
-    output = output.replace("GAME_NUMBER", str(gnumber))
-    output = output.replace("GAME_DATE", info_packet[DATE])
-    topening = info_packet[OPENING].split("/")[-1]
-    output = output.replace("GAME_OPENING", topening)
-    output = output.replace("GAME_WHITE", info_packet[WHITE])
-    output = output.replace("GAME_BLACK", info_packet[BLACK])
-    ofile = os.path.join("games", ofilen + ".html")
-    with open(ofile, 'w') as iofd:
-        iofd.write(output)
+    header, trailer = get_header_trailer("game_page")
+    with open(game_page_file(info_packet), 'w') as iofd:
+        write_table(iofd, fill_game_fields(header, info_packet), tbl_info,
+                    fill_game_fields(trailer, info_packet))
+
+
+def write_pages(batch):
+    """
+    Write a batch of pages.
+
+    Args:
+        batch -- list of (file name, html text) tuples
+    """
+    for ofile, text in batch:
+        with open(ofile, 'w') as iofd:
+            iofd.write(text)
+        tally("write_game_pages", bytes_written=len(text))
+
+
+def remove_stale_pages(odir, keep):
+    """
+    Delete the game pages in odir (game*.html files, including pages
+    named by game number by older versions) whose names are not in keep.
+
+    Returns: number of pages deleted
+    """
+    removed = 0
+    for file_name in os.listdir(odir):
+        if (file_name.startswith("game") and file_name.endswith(".html")
+                and file_name not in keep):
+            os.remove(os.path.join(odir, file_name))
+            removed += 1
+    return removed
+
+
+@timed("write_game_pages")
+def write_changed_pages(pages, odir=GAMES_DIR):
+    """
+    Write the pages whose contents changed since the last run.
+
+    A manifest in odir records a content hash for every page.  Pages
+    whose hash has not changed (and whose file still exists) are
+    skipped.  The rest are written in batches of PAGE_BATCH pages by a
+    pool of PAGE_THREADS threads.  Pages and manifest entries of games
+    that are no longer in pages are deleted.
+
+    Args:
+        pages -- iterable of (manifest key, file name, html text) tuples
+        odir -- directory holding the pages and the manifest
+
+    Returns: tuple of the number of pages written, the number of pages
+    that were unchanged and the number of pages deleted.
+    """
+    old_manifest = read_manifest(odir)
+    manifest = {}
+    keep = set()
+    batch = []
+    futures = []
+    written = 0
+    unchanged = 0
+    with ThreadPoolExecutor(max_workers=PAGE_THREADS) as pool:
+        for key, ofile, text in pages:
+            keep.add(os.path.basename(ofile))
+            digest = hashlib.sha256(text.encode()).hexdigest()
+            manifest[key] = {M_HASH: digest}
+            if (old_manifest.get(key, {}).get(M_HASH) == digest and
+                    os.path.exists(ofile)):
+                unchanged += 1
+                continue
+            batch.append((ofile, text))
+            written += 1
+            if len(batch) >= PAGE_BATCH:
+                futures.append(pool.submit(write_pages, batch))
+                batch = []
+        if batch:
+            futures.append(pool.submit(write_pages, batch))
+    for future in futures:
+        future.result()
+    removed = remove_stale_pages(odir, keep)
+    write_manifest(odir, manifest)
+    return written, unchanged, removed
@@ -0,0 +1,156 @@
+"""
+Opening tree built from the moves actually played.
+
+Every game is followed through its first plies in a tree (a trie) keyed
+on the moves in Standard Algebraic Notation.  Each node holds my record
+in the games that started with the moves leading to it, using the six
+won/loss categories of openings.get_my_opening_record.  Looking up any
+sequence of moves, or reporting on the lines that follow it, only walks
+down the tree instead of scanning opening names.
+"""
+from chess_career.columns import get_columns, C_COLOR, C_RESULT
+from chess_career.extract_game import extract_data, O_ALL_DATA
+from chess_career.io_module import generate_table_report
+from chess_career.openings import record_bucket, gen_wdl_string
+from chess_career.replay import san_moves, FEN_TAG
+from chess_career.utilities import GAMEREC
+O_OPENING_TREE = "opening_tree"
+TREE_DEPTH = 20
+SAN_DECORATIONS = "+#!?"
+
+
+class OpeningNode():
+    """
+    One move sequence in the opening tree.
+
+    children is a dictionary indexed by the next move.  record holds six
+    lists of game numbers in the order used by get_my_opening_record.
+    """
+    __slots__ = ("children", "record")
+
+    def __init__(self):
+        self.children = {}
+        self.record = [[], [], [], [], [], []]
+
+    def count(self):
+        """
+        Return the number of games that reached this node
+        """
+        return sum(len(bucket) for bucket in self.record)
+
+
+def move_list(moves):
+    """
+    Return moves (a space separated string or a list of moves in
+    Standard Algebraic Notation) as a list with check and annotation
+    marks removed, so that the moves match the keys of the tree.
+    """
+    if isinstance(moves, str):
+        moves = san_moves(moves)
+    return [move.rstrip(SAN_DECORATIONS) for move in moves]
+
+
+def build_opening_tree(data, depth=TREE_DEPTH):
+    """
+    Build the opening tree in one pass over the games.
+
+    Args:
+        data -- value returned by extract_data
+        depth -- number of plies of each game added to the tree
+
+    Returns: root OpeningNode.  The root's record covers every game
+    that starts from the normal starting position (games with a FEN tag
+    are left out).
+    """
+    cols = get_columns(data)
+    root = OpeningNode()
+    for gnumb, game in enumerate(data[O_ALL_DATA]):
+        if FEN_TAG in game:
+            continue
+        bucket = record_bucket(cols[C_COLOR][gnumb], cols[C_RESULT][gnumb])
+        node = root
+        node.record[bucket].append(gnumb)
+        for move in move_list(game[GAMEREC])[:depth]:
+            if move not in node.children:
+                node.children[move] = OpeningNode()
+            node = node.children[move]
+            node.record[bucket].append(gnumb)
+    return root
+
+
+def get_opening_tree(data):
+    """
+    Return the opening tree for extract_data output, building it the
+    first time it is asked for.  The tree is saved in data under
+    O_OPENING_TREE.
+    """
+    if O_OPENING_TREE not in data:
+        data[O_OPENING_TREE] = build_opening_tree(data)
+    return data[O_OPENING_TREE]
+
+
+def find_node(tree, moves):
+    """
+    Return the node of tree reached by moves (see move_list), or None if
+    no game started with those moves.
+    """
+    node = tree
+    for move in move_list(moves):
+        node = node.children.get(move)
+        if node is None:
+            return None
+    return node
+
+
+def prefix_record(data, moves):
+    """
+    Return my record in the games starting with moves, in the same six
+    category form as an entry of get_my_opening_record.
+    """
+    node = find_node(get_opening_tree(data), moves)
+    if node is None:
+        return [[], [], [], [], [], []]
+    return node.record
+
+
+def continuation_info_data(data, moves=""):
+    """
+    Summarize the moves played after a sequence of moves, in the same
+    form as openings.general_opening_info_data: a list of [line, won/
+    drawn/lost counts, number of games] entries, most played first.
+    """
+    prefix = move_list(moves)
+    node = find_node(get_opening_tree(data), prefix)
+    if node is None:
+        return []
+    op_records = []
+    for move, child in node.children.items():
+        wlt_data = [len(child.record[indx]) for indx in (2, 1, 0, 5, 4, 3)]
+        op_records.append([" ".join(prefix + [move]), wlt_data,
+                           child.count()])
+    return sorted(op_records, key=lambda x: x[2], reverse=True)
+
+
+def generate_tree_report(moves="", data=None):
+    """
+    Generate an opening report of the moves played after moves (all
+    first moves if empty), in the layout of the general openings report.
+
+    Input:
+        moves -- sequence of moves ("e4 c5" for example)
+        data -- value returned by extract_data.  extract_data is called
+                if not set.
+    """
+    if data is None:
+        data = extract_data()
+    out_lines = []
+    for line, wlt_data, gcount in continuation_info_data(data, moves):
+        out_lines.append(["{}".format(gcount), line,
+                          gen_wdl_string(wlt_data[0:3]),
+                          gen_wdl_string(wlt_data[3:6])])
+    specific = "_".join(move_list(moves)) or "first_move"
+    generate_table_report("general_openings_report", out_lines, specific)
+
+
+if __name__ == "__main__":
+    generate_tree_report()
@@ -1,16 +1,31 @@
 """
 Collect information on openings played
 """
-from chess_career.extract_game import extract_data
+from chess_career.extract_game import extract_data, window_games
 from chess_career.io_module import generate_table_report
-from chess_career.extract_game import O_ALL_DATA, O_MYWINS, O_WHITE, O_DRAWS
-ECOURL = 'ECOUrl'
+from chess_career.columns import get_columns, C_COLOR, C_OPENING, C_RESULT
+from chess_career.columns import C_OPENING_NAMES, RES_WIN, RES_DRAW
+from chess_career.profiling import timed
+O_TAXONOMY = "taxonomy"
+TX_RECORDS = "records"
+TX_CHILDREN = "children"
+TX_FAMILIES = "families"
+TX_PATHS = "paths"
+TX_PREFIXES = "prefixes"
+FAMILY_KEYWORDS = ('Defense', 'Opening', 'Game', 'Gambit', 'Attack',
+                   'System')
+VARIATION_KEYWORDS = FAMILY_KEYWORDS + ('Variation', 'Line', 'Accepted',
+                                        'Declined', 'Countergambit')
+OPENING_GROUPS = ["Queens-Pawn", "Kings-Pawn", "Sicilian", "French",
+                  "Philidor", "Scotch"]
 
 
-def get_my_opening_record(data):
+def get_my_opening_record(data, window=None):
     """
     Args:
         data -- game data extracted
+        window -- only count games inside this time window (see
+                  extract_game.window_games).  All games if not set.
 
     Returns: List of won/loss info.  Each entry is a list of game numbers
         that are in this category.  The categories in order are: games
@@ -18,79 +33,172 @@ def get_my_opening_record(data):
         games won as black, games drwan as black, games lost as black.
     """
     rdict = {}
-    for count, entry in enumerate(data[O_ALL_DATA]):
-        if ECOURL in entry:
-            opening = entry[ECOURL].split("/")[-1]
-        else:
-            opening = 'Unknown-Opening'
-        indx = 0
-        if count in data[O_MYWINS]:
-            indx += 2
-        if count in data[O_DRAWS]:
-            indx += 1
-        if count not in data[O_WHITE]:
-            indx += 3
+    cols = get_columns(data)
+    names = cols[C_OPENING_NAMES]
+    opids = cols[C_OPENING]
+    colors = cols[C_COLOR]
+    results = cols[C_RESULT]
+    for count in window_games(data, window):
+        opening = names[opids[count]]
         if opening not in rdict:
             rdict[opening] = [[], [], [], [], [], []]
-        rdict[opening][indx].append(count)
+        rdict[opening][record_bucket(colors[count],
+                                     results[count])].append(count)
     return rdict
 
 
-def remove_excess(inchar, opening, loc_val):
+def record_bucket(color, result):
     """
-    Remove the additional data from an opening name in order to return
-    the general name of the opening.
+    Return the index of the won/loss category (see get_my_opening_record)
+    of a game, given its C_COLOR and C_RESULT column values.
+    """
+    indx = 3 * color
+    if result == RES_WIN:
+        indx += 2
+    if result == RES_DRAW:
+        indx += 1
+    return indx
+
+
+def opening_games(my_rec, opening):
+    """
+    Return the set of game numbers played in an opening.  The result can
+    be passed to extract_game.select_games as a category.
+
+    Args:
+        my_rec -- value returned by get_my_opening_record (or either
+                  dictionary returned by get_openings)
+        opening -- key of my_rec
+    """
+    games = set()
+    for bucket in my_rec.get(opening, []):
+        games.update(bucket)
+    return games
+
+
+def opening_path(opening):
+    """
+    Split an opening name into its levels, from the general opening
+    down to the full name.
+
+    The first level ends at the first word (after the first) that is
+    in FAMILY_KEYWORDS, so 'Sicilian-Defense-Bowdler-Attack' starts with
+    'Sicilian-Defense'.  Each later level ends at a word in
+    VARIATION_KEYWORDS or at a move ('3.d4').  Each level is the name
+    of the opening up to that point.
+
+    Returns: list of names, the last of which is opening
+    """
+    words = opening.split("-")
+    path = []
+    keywords = FAMILY_KEYWORDS
+    for count, word in enumerate(words[:-1]):
+        if count == 0:
+            continue
+        if word in keywords or (path and word[:1].isdigit()):
+            path.append("-".join(words[:count + 1]))
+            keywords = VARIATION_KEYWORDS
+    path.append(opening)
+    return path
+
+
+def build_taxonomy(my_rec):
+    """
+    Arrange the openings played into a hierarchy (general opening ->
+    variation -> sub-variation ...) using opening_path.
 
     Args:
-        inchar: character to scan for after which all further
-                text will be discarded
-        opening: full name of the opening
-        loc_val: location in opening from which point we should scan for inchar
+        my_rec -- value returned by get_my_opening_record
+
+    Returns a dictionary of:
 
-    Returns;
-        Shortened, more general name
+    TX_RECORDS -- dictionary indexed by node name of won/loss
+                  categories (see get_my_opening_record) of all games
+                  in the node or below it.
+    TX_CHILDREN -- dictionary indexed by node name of the sorted list of
+                   the names of the nodes directly below it.
+    TX_FAMILIES -- sorted list of the top level (general) openings.
+    TX_PATHS -- dictionary indexed by full opening name of the list of
+                nodes containing it (see opening_path).  This maps
+                every game, through its opening, to all of its
+                ancestor nodes.
+    TX_PREFIXES -- dictionary indexed by every leading group of words of
+                   an opening name ('Queens-Pawn' for example) of the
+                   sorted list of full opening names that start with it.
+    """
+    taxonomy = {TX_RECORDS: {}, TX_CHILDREN: {}, TX_FAMILIES: [],
+                TX_PATHS: {}, TX_PREFIXES: {}}
+    children = {}
+    for opening, record in my_rec.items():
+        path = opening_path(opening)
+        taxonomy[TX_PATHS][opening] = path
+        parent = None
+        for node in path:
+            if node not in taxonomy[TX_RECORDS]:
+                taxonomy[TX_RECORDS][node] = [[], [], [], [], [], []]
+            for indx, bucket in enumerate(record):
+                taxonomy[TX_RECORDS][node][indx].extend(bucket)
+            children.setdefault(node, set())
+            if parent is not None:
+                children[parent].add(node)
+            parent = node
+        words = opening.split("-")
+        for count in range(1, len(words) + 1):
+            prefix = "-".join(words[:count])
+            taxonomy[TX_PREFIXES].setdefault(prefix, []).append(opening)
+    for node, kids in children.items():
+        taxonomy[TX_CHILDREN][node] = sorted(kids)
+    taxonomy[TX_FAMILIES] = sorted(
+        {path[0] for path in taxonomy[TX_PATHS].values()})
+    for names in taxonomy[TX_PREFIXES].values():
+        names.sort()
+    return taxonomy
 
-    In other words, change 'Sicilian Defense Bowdler Attack'
-    to 'Sicilian Defense'
+
+def get_taxonomy(data, my_rec=None):
+    """
+    Return the opening taxonomy for extract_data output, building it
+    the first time it is asked for.  The taxonomy is saved in data under
+    O_TAXONOMY.  my_rec is the value of get_my_opening_record(data), if
+    the caller already has it.
     """
-    xloc = opening.find(inchar, loc_val)
-    if xloc == -1:
-        return opening
-    return opening[0:xloc]
+    if O_TAXONOMY not in data:
+        if my_rec is None:
+            my_rec = get_my_opening_record(data)
+        data[O_TAXONOMY] = build_taxonomy(my_rec)
+    return data[O_TAXONOMY]
 
 
-def get_openings():
+@timed("get_openings")
+def get_openings(data=None, window=None):
     """
     Find all openings played
 
-    Returns: A list with two entries.  The first entry is a dictionary
+    Args:
+        data -- game data extracted.  extract_data is called if not set.
+        window -- only count games inside this time window (see
+                  extract_game.window_games).  All games if not set.
+
+    Returns: A list with three entries.  The first entry is a dictionary
     of all games that I have played.  Indexed by full name of the openings,
     the value stored is a list of game numbers matching that opening.
     The second entry is also a dictionary of general openings
     (keys are "Sicilian Defense" rather than all variations of the Sicilian).
+    The third entry is the opening taxonomy (see build_taxonomy).
     """
-    data = extract_data()
-    my_rec = get_my_opening_record(data)
-    op_list_short = {}
-    for entry in my_rec:
-        loc_val = 1000
-        for keyword in [
-                'Defense', 'Opening', 'Game', 'Gambit', 'Attack', 'System'
-        ]:
-            thisval = entry.find(keyword)
-            if thisval > 0:
-                if thisval < loc_val:
-                    loc_val = thisval
-        op_name = remove_excess("-", entry, loc_val)
-        op_name = remove_excess(".", op_name, loc_val)
-        if op_name not in op_list_short:
-            op_list_short[op_name] = [[], [], [], [], [], []]
-        for i in range(0, len(op_list_short[op_name])):
-            op_list_short[op_name][i].extend(my_rec[entry][i])
-    return [my_rec, op_list_short]
-
-
-def general_opening_info_data(ogroup=""):
+    if data is None:
+        data = extract_data()
+    my_rec = get_my_opening_record(data, window)
+    if window is None:
+        taxonomy = get_taxonomy(data, my_rec)
+    else:
+        taxonomy = build_taxonomy(my_rec)
+    op_list_short = {family: taxonomy[TX_RECORDS][family]
+                     for family in taxonomy[TX_FAMILIES]}
+    return [my_rec, op_list_short, taxonomy]
+
+
+def general_opening_info_data(ogroup="", openings=None):
     """
     Reformat opening information into a list whose entries are:
     - Number of games
@@ -99,22 +207,50 @@ def general_opening_info_data(ogroup=""):
     - Win/loss/Draw record as black (a string)
 
     Args:
-        ogroup -- Opening name ("Sicilian" for example).
+        ogroup -- Opening name ("Sicilian" for example).  Must be a
+                  leading group of words of the opening names matched.
                   General opening names if blank
+        openings -- value returned by get_openings.  get_openings is
+                  called if not set.
     """
     otype = 1
     if ogroup:
         otype = 0
-    openings = get_openings()[otype]
+    if openings is None:
+        openings = get_openings()
+    entries = openings[otype]
+    if ogroup:
+        entries = openings[2][TX_PREFIXES].get(ogroup, [])
+    return opening_info_data(openings[otype], entries)
+
+
+def node_info_data(node="", openings=None):
+    """
+    Like general_opening_info_data, but list the openings one level
+    below a node of the taxonomy (the general openings if node is
+    blank).  Each entry covers all games in that node or below it.
+    """
+    if openings is None:
+        openings = get_openings()
+    taxonomy = openings[2]
+    if node:
+        entries = taxonomy[TX_CHILDREN].get(node, [])
+    else:
+        entries = taxonomy[TX_FAMILIES]
+    return opening_info_data(taxonomy[TX_RECORDS], entries)
+
+
+def opening_info_data(records, entries):
+    """
+    Return the [name, won/drawn/lost counts, number of games] list of
+    entries (keys of records), most played first.
+    """
     op_records = []
-    for entry in openings:
-        if ogroup:
-            if entry.find(ogroup) != 0:
-                continue
+    for entry in entries:
         gcount = 0
         wlt_data = []
         for indx in (2, 1, 0, 5, 4, 3):
-            wldval = len(openings[entry][indx])
+            wldval = len(records[entry][indx])
             wlt_data.append(wldval)
             gcount += wldval
         op_records.append([entry, wlt_data, gcount])
@@ -132,19 +268,25 @@ def gen_wdl_string(wld_data):
     return "{}-{}-{}".format(wld_data[0], wld_data[2], wld_data[1])
 
 
-def generate_opening_report(ogroup=""):
+def generate_opening_report(ogroup="", openings=None, window=None):
     """
     User interface to generate opening reports.
 
     Input:
         ogroup -- Opening to search for.  If empty, a general opening
                   search is performed.
+        openings -- value returned by get_openings.  get_openings is
+                  called if not set.
+        window -- time window passed to get_openings when openings is
+                  not set (see extract_game.window_games)
 
     Result:
         In reports sub-directory, an appropriately name file ending with
         "_openings_report" will be generated
     """
-    info = general_opening_info_data(ogroup)
+    if openings is None:
+        openings = get_openings(window=window)
+    info = general_opening_info_data(ogroup, openings)
     out_lines = []
     for inline in info:
         out_line = []
@@ -157,11 +299,24 @@ def generate_opening_report(ogroup=""):
     generate_table_report("general_openings_report", out_lines, ogroup)
 
 
+def generate_opening_reports(ogroups, window=None, data=None):
+    """
+    Generate the general opening report plus one report for each opening
+    in ogroups.  Games are extracted and classified only once, and all
+    reports are produced from that result.
+
+    Input:
+        ogroups -- list of openings to search for ("Sicilian" for example)
+        window -- only report on games inside this time window (see
+                  extract_game.window_games).  All games if not set.
+        data -- value returned by extract_data.  extract_data is called
+                if not set.
+    """
+    openings = get_openings(data, window)
+    generate_opening_report("", openings)
+    for ogroup in ogroups:
+        generate_opening_report(ogroup, openings)
+
+
 if __name__ == "__main__":
-    generate_opening_report()
-    generate_opening_report("Queens-Pawn")
-    generate_opening_report("Kings-Pawn")
-    generate_opening_report("Sicilian")
-    generate_opening_report("French")
-    generate_opening_report("Philidor")
-    generate_opening_report("Scotch")
+    generate_opening_reports(OPENING_GROUPS)
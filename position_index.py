@@ -0,0 +1,222 @@
+"""
+Index of every position reached in my games.
+
+Each position is identified by a 64 bit Zobrist hash (the exclusive or
+of a random number for every piece on its square, the side to move, the
+castling rights and a usable en passant file).  The index maps each
+hash to the (game number, ply) pairs where that position was reached,
+so finding the games that reached a position is a dictionary lookup
+instead of a replay of every game.
+
+The index is built one monthly file at a time, and the part for each
+month is pickled in the cache directory, so only new or changed months
+are replayed on later runs.
+"""
+import os
+import random
+from chess_career.extract_game import (
+    cache_key,
+    load_month,
+    month_files,
+    read_cache,
+    write_cache,
+    CACHE_DIR,
+    DATA_PATH,
+    O_DATA_PATH
+)
+from chess_career.io_module import JSON
+from chess_career.check_mate import NSQUARES, PAWN_TABLE
+from chess_career.columns import get_columns, C_COLOR, C_RESULT
+from chess_career.openings import record_bucket
+from chess_career.replay import replay, Board, FEN_TAG, START_FEN
+from chess_career.utilities import GAMEREC
+O_POSITIONS = "positions"
+POSITION_SUFFIX = ".positions.pickle"
+POSITION_VERSION = 1
+ZOBRIST_SEED = 20200101
+ZOBRIST_PIECES = "PNBRQKpnbrqk"
+CASTLE_RIGHTS = "KQkq"
+
+
+def zobrist_keys():
+    """
+    Return the random numbers used by zobrist_hash as a tuple of:
+        dictionary indexed by piece letter of lists indexed by square
+        number
+        number for black to move
+        dictionary indexed by castling right letter
+        list indexed by en passant file
+    The numbers come from a fixed seed so that hashes saved on disk stay
+    valid from one run to the next.
+    """
+    rgen = random.Random(ZOBRIST_SEED)
+    pieces = {piece: [rgen.getrandbits(64) for _ in range(NSQUARES)]
+              for piece in ZOBRIST_PIECES}
+    black = rgen.getrandbits(64)
+    castle = {right: rgen.getrandbits(64) for right in CASTLE_RIGHTS}
+    ep_files = [rgen.getrandbits(64) for _ in range(8)]
+    return pieces, black, castle, ep_files
+
+
+Z_PIECES, Z_BLACK, Z_CASTLE, Z_EP_FILE = zobrist_keys()
+
+
+def ep_capturable(board):
+    """
+    True if a pawn of the side to move could capture en passant.
+    """
+    if board.ep_square < 0:
+        return False
+    if board.white:
+        return any(board.squares[sq] == 'P'
+                   for sq in PAWN_TABLE['p'][board.ep_square])
+    return any(board.squares[sq] == 'p'
+               for sq in PAWN_TABLE['P'][board.ep_square])
+
+
+def zobrist_hash(board):
+    """
+    Return the Zobrist hash of a replay.Board.  The move counters are not
+    part of the hash, and the en passant square only counts when an en
+    passant capture is possible, so transpositions hash the same.
+    """
+    zhash = 0
+    for square, piece in enumerate(board.squares):
+        if piece:
+            zhash ^= Z_PIECES[piece][square]
+    if not board.white:
+        zhash ^= Z_BLACK
+    for right in board.castling:
+        zhash ^= Z_CASTLE.get(right, 0)
+    if ep_capturable(board):
+        zhash ^= Z_EP_FILE[board.ep_square % 8]
+    return zhash
+
+
+def fen_hash(fen_data):
+    """
+    Return the Zobrist hash of the position in a FEN string
+    """
+    return zobrist_hash(Board(fen_data))
+
+
+def game_positions(game):
+    """
+    Return the list of hashes of the positions after each ply of a game.
+    If a move cannot be replayed, the list stops at the last position
+    that could be reached.
+    """
+    hashes = []
+    try:
+        for _, board in replay(game[GAMEREC], game.get(FEN_TAG, START_FEN)):
+            hashes.append(zobrist_hash(board))
+    except ValueError:
+        pass
+    return hashes
+
+
+def month_positions(month_list):
+    """
+    Index the positions of one month of games.
+
+    Args:
+        month_list -- games in a month (see extract_game.load_month)
+
+    Returns: dictionary indexed by position hash of lists of (game,
+    ply) tuples, where game is the index of the game in month_list.
+    """
+    positions = {}
+    for count, game in enumerate(month_list):
+        for ply, zhash in enumerate(game_positions(game)):
+            positions.setdefault(zhash, []).append((count, ply))
+    return positions
+
+
+def position_cache_file(jfile):
+    """
+    Return the name of the file holding the position index of jfile
+    """
+    jdir, jname = os.path.split(jfile)
+    return os.path.join(jdir, CACHE_DIR,
+                        jname[:-len(JSON)] + POSITION_SUFFIX)
+
+
+def load_month_positions(jfile):
+    """
+    Return a tuple of the number of games in a monthly file and the
+    index of its positions (see month_positions).  The result is saved
+    in the cache directory, so a month is only replayed again when its
+    json file changes.
+    """
+    ckey = (POSITION_VERSION,) + cache_key(jfile)
+    cfile = position_cache_file(jfile)
+    month_info = read_cache(cfile, ckey)
+    if month_info is None:
+        month_list = load_month(jfile)
+        month_info = (len(month_list), month_positions(month_list))
+        write_cache(cfile, ckey, month_info)
+    return month_info
+
+
+def build_position_index(data_dir=DATA_PATH):
+    """
+    Combine the position indexes of all monthly files in data_dir.
+
+    Returns: dictionary indexed by position hash of lists of (game
+    number, ply) tuples in game order.  Game numbers match the
+    O_ALL_DATA list returned by extract_data.  Ply 0 is the position
+    after white's first move.
+    """
+    index = {}
+    offset = 0
+    for jfile in month_files(data_dir):
+        ngames, positions = load_month_positions(jfile)
+        for zhash, entries in positions.items():
+            index.setdefault(zhash, []).extend(
+                [(offset + count, ply) for count, ply in entries])
+        offset += ngames
+    return index
+
+
+def get_position_index(data):
+    """
+    Return the position index for extract_data output, building it the
+    first time it is asked for.  The index is saved in data under
+    O_POSITIONS.
+    """
+    if O_POSITIONS not in data:
+        data[O_POSITIONS] = build_position_index(
+            data.get(O_DATA_PATH, DATA_PATH))
+    return data[O_POSITIONS]
+
+
+def position_games(data, fen_data):
+    """
+    Find every time a position was reached.
+
+    Args:
+        data -- value returned by extract_data
+        fen_data -- FEN of the position (move counters are ignored)
+
+    Returns: list of (game number, ply) tuples
+    """
+    return get_position_index(data).get(fen_hash(fen_data), [])
+
+
+def position_record(data, fen_data):
+    """
+    Return my record in the games that reached a position, in the same
+    six category form as an entry of openings.get_my_opening_record.
+    A game that reached the position more than once is only counted
+    once.
+    """
+    cols = get_columns(data)
+    record = [[], [], [], [], [], []]
+    seen = set()
+    for gnumb, _ in position_games(data, fen_data):
+        if gnumb in seen:
+            continue
+        seen.add(gnumb)
+        bucket = record_bucket(cols[C_COLOR][gnumb], cols[C_RESULT][gnumb])
+        record[bucket].append(gnumb)
+    return record
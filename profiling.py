@@ -0,0 +1,213 @@
+"""
+Optional per-stage profiling.
+
+Profiling is off unless the CHESS_CAREER_PROFILE environment variable is
+set or enable() is called.  While it is on, every stage records its
+wall time, number of calls, bytes read and written and games processed,
+and a JSON summary is written when the program exits: to the file named
+by CHESS_CAREER_PROFILE, or to stderr if its value is 1.
+
+Stages are marked with the timed decorator or the section context
+manager, and counters are added with tally.  When profiling is off these
+only check a flag, so the instrumented code runs at its normal speed.
+Counters may be updated from several threads.  Process pools should be
+run through pool_map, which sends the counters recorded in each worker
+back with its result and adds them to this process's profile (so the
+seconds of a stage run in parallel can add up to more than the wall
+time).
+"""
+import atexit
+import collections
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+PROFILE_ENV = "CHESS_CAREER_PROFILE"
+P_SECONDS = "seconds"
+P_CALLS = "calls"
+P_READ = "bytes_read"
+P_WRITTEN = "bytes_written"
+P_GAMES = "games"
+PROFILE = {"enabled": False, "output": None, "start": 0.0, "stages": {}}
+NO_SECTION = contextlib.nullcontext()
+STATS_LOCK = threading.Lock()
+
+
+def enable(output=None):
+    """
+    Turn profiling on.  The summary is written to the file output when
+    the program exits (to stderr if output is not set).
+    """
+    if not PROFILE["enabled"]:
+        atexit.register(write_summary)
+        PROFILE["start"] = time.perf_counter()
+    PROFILE["enabled"] = True
+    PROFILE["output"] = output
+
+
+def stage_stats(name):
+    """
+    Return the counters of a stage, creating them the first time.
+    Callers hold STATS_LOCK.
+    """
+    if name not in PROFILE["stages"]:
+        PROFILE["stages"][name] = {P_SECONDS: 0.0, P_CALLS: 0, P_READ: 0,
+                                   P_WRITTEN: 0, P_GAMES: 0}
+    return PROFILE["stages"][name]
+
+
+def tally(name, games=0, bytes_read=0, bytes_written=0):
+    """
+    Add to the games processed and bytes read or written by a stage.
+    """
+    if not PROFILE["enabled"]:
+        return
+    with STATS_LOCK:
+        stats = stage_stats(name)
+        stats[P_GAMES] += games
+        stats[P_READ] += bytes_read
+        stats[P_WRITTEN] += bytes_written
+
+
+@contextlib.contextmanager
+def timed_section(name):
+    """
+    Context manager that adds the time spent inside it to a stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with STATS_LOCK:
+            stats = stage_stats(name)
+            stats[P_SECONDS] += elapsed
+            stats[P_CALLS] += 1
+
+
+def section(name):
+    """
+    Return a context manager that times a block of code as stage name
+    (a shared do-nothing context manager if profiling is off).
+    """
+    if not PROFILE["enabled"]:
+        return NO_SECTION
+    return timed_section(name)
+
+
+def timed(name):
+    """
+    Decorator that times every call of a function as stage name.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE["enabled"]:
+                return func(*args, **kwargs)
+            with timed_section(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def merge_stages(stages):
+    """
+    Add the stage counters recorded by another process to this one.
+    """
+    with STATS_LOCK:
+        for name, counters in stages.items():
+            stats = stage_stats(name)
+            for key, value in counters.items():
+                stats[key] += value
+
+
+def run_profiled(func, enabled, *args):
+    """
+    Call func(*args) in a pool worker process, with profiling on if
+    enabled is set.  Only the counters of this call are recorded.
+
+    Returns: tuple of the value returned by func and the stage counters
+    recorded by the call (None if profiling is off).
+    """
+    if not enabled:
+        return func(*args), None
+    PROFILE["enabled"] = True
+    PROFILE["stages"] = {}
+    result = func(*args)
+    return result, PROFILE["stages"]
+
+
+def pool_map(pool, func, *iterables, ahead=None):
+    """
+    Generator with the results of pool.map(func, *iterables) (in order,
+    as they become available).  The counters recorded in the worker
+    processes are added to this process's profile.
+
+    If ahead is set, at most ahead calls are submitted at a time, and
+    the next call is submitted as each result is yielded, so that no
+    more than ahead results are held waiting for the caller.
+    """
+    worker = functools.partial(run_profiled, func, PROFILE["enabled"])
+    if ahead is None:
+        results = pool.map(worker, *iterables)
+    else:
+        results = bounded_map(pool, worker, zip(*iterables), ahead)
+    for result, stages in results:
+        if stages:
+            merge_stages(stages)
+        yield result
+
+
+def bounded_map(pool, func, arg_tuples, ahead):
+    """
+    Generator with the results of func(*args) for each tuple in
+    arg_tuples, run by pool with at most ahead calls in flight.
+    """
+    arg_tuples = iter(arg_tuples)
+    pending = collections.deque()
+    for args in arg_tuples:
+        pending.append(pool.submit(func, *args))
+        if len(pending) >= ahead:
+            break
+    while pending:
+        result = pending.popleft().result()
+        for args in arg_tuples:
+            pending.append(pool.submit(func, *args))
+            break
+        yield result
+
+def summary():
+    """
+    Return the profile as a dictionary of the total wall time since
+    profiling was turned on and the counters of every stage.
+    """
+    return {
+        "argv": sys.argv,
+        "total_seconds": time.perf_counter() - PROFILE["start"],
+        "stages": PROFILE["stages"]
+    }
+
+
+def write_summary():
+    """
+    Write the JSON summary of the profile (see enable).  Nothing is
+    written from pool worker processes (their counters are merged into
+    the parent's by pool_map).
+    """
+    if multiprocessing.parent_process() is not None:
+        return
+    text = json.dumps(summary(), indent=1, sort_keys=True)
+    if PROFILE["output"]:
+        with open(PROFILE["output"], 'w') as iofd:
+            iofd.write(text + "\n")
+    else:
+        sys.stderr.write(text + "\n")
+
+
+if os.environ.get(PROFILE_ENV):
+    enable(None if os.environ[PROFILE_ENV] == "1"
+           else os.environ[PROFILE_ENV])
@@ -0,0 +1,384 @@
+"""
+Replay games from their move text.
+
+Board is a compact board (a list of 64 squares, indexed like the tables
+in check_mate.py) that is updated in place one move at a time.  The
+SAN parser turns each move of a game record into a move on that board,
+so that every position reached in every game can be produced as a
+stream without storing the games' positions.
+"""
+import re
+from chess_career.check_mate import (
+    BOARD_DIM,
+    DIAGONAL,
+    KING_TABLE,
+    KNIGHT_TABLE,
+    LINE_STEPS,
+    NSQUARES,
+    ORTHOGONAL,
+    PAWN_TABLE,
+    on_board
+)
+from chess_career.extract_game import O_ALL_DATA
+from chess_career.utilities import GAMEREC
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_TAG = "FEN"
+FILES = "abcdefgh"
+SAN_PATTERN = re.compile(
+    r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?[+#]?[!?]*$')
+CASTLE_PATTERN = re.compile(r'^([O0]-[O0](?:-[O0])?)[+#]?[!?]*$')
+SKIP_PATTERN = re.compile(r'\{[^}]*\}|\([^)]*\)|\$\d+')
+MOVE_NUMBER = re.compile(r'^\d+\.+')
+RESULTS = ["1-0", "0-1", "1/2-1/2", "*"]
+ROOK_HOMES = {0: "Q", 7: "K", 56: "q", 63: "k"}
+SLIDERS = {DIAGONAL: "BQ", ORTHOGONAL: "RQ"}
+
+
+def build_rays():
+    """
+    Return a dictionary indexed by line type (DIAGONAL or ORTHOGONAL)
+    of lists indexed by square.  Each entry is a list of rays, and each
+    ray is the tuple of squares moving outward from that square in one
+    direction.
+    """
+    rays = {}
+    for ltype, steps in LINE_STEPS.items():
+        rays[ltype] = []
+        for square in range(NSQUARES):
+            row, col = divmod(square, BOARD_DIM)
+            sq_rays = []
+            for rstep, cstep in steps:
+                ray = []
+                trow, tcol = row + rstep, col + cstep
+                while on_board(trow, tcol):
+                    ray.append(trow * BOARD_DIM + tcol)
+                    trow, tcol = trow + rstep, tcol + cstep
+                if ray:
+                    sq_rays.append(tuple(ray))
+            rays[ltype].append(sq_rays)
+    return rays
+
+
+RAYS = build_rays()
+
+
+def square_name(square):
+    """
+    Return the algebraic name (e4 for example) of a square number
+    """
+    return FILES[square % BOARD_DIM] + str(square // BOARD_DIM + 1)
+
+
+def name_square(name):
+    """
+    Return the square number of an algebraic square name
+    """
+    return (int(name[1]) - 1) * BOARD_DIM + FILES.index(name[0])
+
+
+def own_piece(piece, white):
+    """
+    Return the letter used for piece (given in upper case) for the side
+    to move.
+    """
+    return piece if white else piece.lower()
+
+
+class Board():
+    """
+    A position that moves can be made on.
+
+    fen_data is the Forsyth-Edwards-Notation of the starting position.
+    """
+    def __init__(self, fen_data=START_FEN):
+        parts = fen_data.split(' ')
+        self.squares = [''] * NSQUARES
+        self.kings = {}
+        for count, rank in enumerate(parts[0].split('/')):
+            square = (BOARD_DIM - 1 - count) * BOARD_DIM
+            for fen_char in rank:
+                if fen_char.isdigit():
+                    square += int(fen_char)
+                else:
+                    self.squares[square] = fen_char
+                    if fen_char in "Kk":
+                        self.kings[fen_char] = square
+                    square += 1
+        self.white = parts[1] == 'w'
+        self.castling = parts[2] if len(parts) > 2 else '-'
+        self.ep_square = -1
+        if len(parts) > 3 and parts[3] != '-':
+            self.ep_square = name_square(parts[3])
+        self.halfmove = int(parts[4]) if len(parts) > 4 else 0
+        self.fullmove = int(parts[5]) if len(parts) > 5 else 1
+
+    def placement(self):
+        """
+        Return the piece placement (first) field of the FEN of this
+        position.
+        """
+        rows = []
+        for row in range(BOARD_DIM - 1, -1, -1):
+            out_row = ''
+            empty = 0
+            for square in range(row * BOARD_DIM, (row + 1) * BOARD_DIM):
+                if self.squares[square] == '':
+                    empty += 1
+                    continue
+                if empty:
+                    out_row += str(empty)
+                    empty = 0
+                out_row += self.squares[square]
+            if empty:
+                out_row += str(empty)
+            rows.append(out_row)
+        return '/'.join(rows)
+
+    def fen(self):
+        """
+        Return the Forsyth-Edwards-Notation of this position
+        """
+        ep_name = '-'
+        if self.ep_square >= 0:
+            ep_name = square_name(self.ep_square)
+        return ' '.join([
+            self.placement(), 'w' if self.white else 'b',
+            self.castling or '-', ep_name, str(self.halfmove),
+            str(self.fullmove)
+        ])
+
+    def attacked(self, square, by_white):
+        """
+        True if square is attacked by a piece of the given side
+        """
+        sqs = self.squares
+        pawn = own_piece('P', by_white)
+        for from_sq in PAWN_TABLE['p' if by_white else 'P'][square]:
+            if sqs[from_sq] == pawn:
+                return True
+        knight = own_piece('N', by_white)
+        for from_sq in KNIGHT_TABLE[square]:
+            if sqs[from_sq] == knight:
+                return True
+        king = own_piece('K', by_white)
+        for from_sq in KING_TABLE[square]:
+            if sqs[from_sq] == king and from_sq != square:
+                return True
+        for ltype, pieces in SLIDERS.items():
+            attackers = own_piece(pieces, by_white)
+            for ray in RAYS[ltype][square]:
+                for from_sq in ray:
+                    if sqs[from_sq]:
+                        if sqs[from_sq] in attackers:
+                            return True
+                        break
+        return False
+
+    def in_check_after(self, from_sq, to_sq):
+        """
+        True if moving the piece on from_sq to to_sq (an ordinary move,
+        not castling or en passant) leaves the mover's king in check.
+        """
+        sqs = self.squares
+        moved = sqs[from_sq]
+        captured = sqs[to_sq]
+        sqs[to_sq] = moved
+        sqs[from_sq] = ''
+        king_sq = self.kings[own_piece('K', self.white)]
+        if moved in "Kk":
+            king_sq = to_sq
+        result = self.attacked(king_sq, not self.white)
+        sqs[from_sq] = moved
+        sqs[to_sq] = captured
+        return result
+
+    def piece_origins(self, piece, to_sq):
+        """
+        Return the squares of the pieces (of the side to move) of type
+        piece (N, B, R, Q or K) that can move to to_sq, ignoring pins.
+        """
+        mover = own_piece(piece, self.white)
+        sqs = self.squares
+        if piece == 'N':
+            return [sq for sq in KNIGHT_TABLE[to_sq] if sqs[sq] == mover]
+        if piece == 'K':
+            return [sq for sq in KING_TABLE[to_sq]
+                    if sqs[sq] == mover and sq != to_sq]
+        origins = []
+        for ltype, pieces in SLIDERS.items():
+            if piece not in pieces:
+                continue
+            for ray in RAYS[ltype][to_sq]:
+                for from_sq in ray:
+                    if sqs[from_sq]:
+                        if sqs[from_sq] == mover:
+                            origins.append(from_sq)
+                        break
+        return origins
+
+    def pawn_origin(self, from_file, to_sq):
+        """
+        Return the square of the pawn moving to to_sq.  from_file is the
+        file letter of a capturing pawn (None for a pawn advance).
+        """
+        step = BOARD_DIM if self.white else -BOARD_DIM
+        pawn = own_piece('P', self.white)
+        if from_file:
+            from_sq = to_sq - step - to_sq % BOARD_DIM + FILES.index(from_file)
+            if 0 <= from_sq < NSQUARES and self.squares[from_sq] == pawn:
+                return from_sq
+            return -1
+        if 0 <= to_sq - step < NSQUARES:
+            if self.squares[to_sq - step] == pawn:
+                return to_sq - step
+            start_row = 3 if self.white else 4
+            if (to_sq // BOARD_DIM == start_row and
+                    self.squares[to_sq - step] == '' and
+                    self.squares[to_sq - 2 * step] == pawn):
+                return to_sq - 2 * step
+        return -1
+
+    def parse_san(self, san):
+        """
+        Convert a move in Standard Algebraic Notation into a tuple of
+        (from square, to square, promotion piece or '').  Raises
+        ValueError if the move cannot be made in this position.
+        """
+        castle = CASTLE_PATTERN.match(san)
+        if castle:
+            from_sq = self.kings[own_piece('K', self.white)]
+            if len(castle.group(1)) == 3:
+                return from_sq, from_sq + 2, ''
+            return from_sq, from_sq - 2, ''
+        parts = SAN_PATTERN.match(san)
+        if not parts:
+            raise ValueError("cannot parse move {}".format(san))
+        piece, from_file, from_rank, to_name, promote = parts.groups()
+        to_sq = name_square(to_name)
+        promote = own_piece(promote, self.white) if promote else ''
+        if not piece:
+            from_sq = self.pawn_origin(from_file, to_sq)
+            if from_sq < 0:
+                raise ValueError("no pawn can play {}".format(san))
+            return from_sq, to_sq, promote
+        origins = self.piece_origins(piece, to_sq)
+        if from_file:
+            origins = [sq for sq in origins
+                       if sq % BOARD_DIM == FILES.index(from_file)]
+        if from_rank:
+            origins = [sq for sq in origins
+                       if sq // BOARD_DIM == int(from_rank) - 1]
+        if len(origins) > 1:
+            origins = [sq for sq in origins
+                       if not self.in_check_after(sq, to_sq)]
+        if len(origins) != 1:
+            raise ValueError("cannot play {} in {}".format(san, self.fen()))
+        return origins[0], to_sq, promote
+
+    def make_move(self, from_sq, to_sq, promote=''):
+        """
+        Make a move, updating the board, castling rights, en passant
+        square, move counters and side to move.
+        """
+        sqs = self.squares
+        moved = sqs[from_sq]
+        captured = sqs[to_sq]
+        kind = moved.upper()
+        if kind == 'P' and to_sq == self.ep_square:
+            captured = sqs[to_sq - (BOARD_DIM if self.white else -BOARD_DIM)]
+            sqs[to_sq - (BOARD_DIM if self.white else -BOARD_DIM)] = ''
+        self.ep_square = -1
+        if kind == 'P' and abs(to_sq - from_sq) == 2 * BOARD_DIM:
+            self.ep_square = (from_sq + to_sq) // 2
+        if kind == 'K':
+            self.kings[moved] = to_sq
+            self.castling = self.castling.replace(
+                own_piece('K', self.white), '').replace(
+                    own_piece('Q', self.white), '')
+            if abs(to_sq - from_sq) == 2:
+                rook_from = from_sq + 3 if to_sq > from_sq else from_sq - 4
+                rook_to = (from_sq + to_sq) // 2
+                sqs[rook_to] = sqs[rook_from]
+                sqs[rook_from] = ''
+        for square in (from_sq, to_sq):
+            if square in ROOK_HOMES:
+                self.castling = self.castling.replace(ROOK_HOMES[square], '')
+        sqs[to_sq] = promote or moved
+        sqs[from_sq] = ''
+        if kind == 'P' or captured:
+            self.halfmove = 0
+        else:
+            self.halfmove += 1
+        if not self.white:
+            self.fullmove += 1
+        self.white = not self.white
+
+    def push_san(self, san):
+        """
+        Make a move given in Standard Algebraic Notation
+        """
+        self.make_move(*self.parse_san(san))
+
+
+def san_moves(gamerec):
+    """
+    Return the list of moves (in Standard Algebraic Notation) in a game
+    record, skipping comments, move numbers and the result.
+    """
+    moves = []
+    for token in SKIP_PATTERN.sub(' ', gamerec).split():
+        token = MOVE_NUMBER.sub('', token)
+        if token and token not in RESULTS:
+            moves.append(token)
+    return moves
+
+
+def replay(gamerec, fen_data=START_FEN):
+    """
+    Generator over the positions reached in a game.  The same Board
+    object is yielded after every ply and is changed by the next ply,
+    so callers should copy out (with fen() for example) whatever they
+    need to keep.
+
+    Args:
+        gamerec -- move text of the game
+        fen_data -- starting position
+
+    Yields: tuple of ply number (0 for the first move) and the board
+    after that ply.  Raises ValueError on a move that cannot be made.
+    """
+    board = Board(fen_data)
+    for ply, san in enumerate(san_moves(gamerec)):
+        board.push_san(san)
+        yield ply, board
+
+
+def game_fens(gamerec, fen_data=START_FEN):
+    """
+    Return the list of the FENs of the positions after each ply
+    """
+    return [board.fen() for _, board in replay(gamerec, fen_data)]
+
+
+def replay_career(data, games=None):
+    """
+    Generator over every position reached in every game.
+
+    Args:
+        data -- value returned by extract_data
+        games -- game numbers to replay (all games if not set)
+
+    Yields: tuple of game number, ply number and board (see replay).
+    A game with a move that cannot be replayed is left at the last
+    position that could be reached.
+    """
+    if games is None:
+        games = range(len(data[O_ALL_DATA]))
+    for gnumb in games:
+        game = data[O_ALL_DATA][gnumb]
+        try:
+            for ply, board in replay(game[GAMEREC],
+                                     game.get(FEN_TAG, START_FEN)):
+                yield gnumb, ply, board
+        except ValueError:
+            continue
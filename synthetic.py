@@ -0,0 +1,410 @@
+"""
+Generate a synthetic career for testing and benchmarking.
+
+The monthly files written here have the shape of the chess.com archives
+read by extract_game: a games list whose entries hold the players and a
+pgn with chess.com style headers, %clk annotated moves and the final
+position.  Every game starts with the first moves of a game from a
+small pool of real games (so that the ECO codes and opening names match
+the moves) and continues with random legal moves, so the career reaches
+many different positions.  Some games are the pool games played to the
+end, which provides checkmates and stalemates.  Everything else
+(players, colors, results, dates and clocks) is also drawn from a
+random number generator with a fixed seed, so the same arguments
+always produce the same files.
+
+Run with:
+    python -m chess_career.synthetic <directory> [number of games]
+"""
+import datetime
+import json
+import os
+import random
+import sys
+from chess_career.check_mate import BOARD_DIM, KING_TABLE, KNIGHT_TABLE
+from chess_career.check_mate import NSQUARES
+from chess_career.io_module import JSON
+from chess_career.replay import (
+    Board,
+    FILES,
+    RAYS,
+    SLIDERS,
+    own_piece,
+    square_name
+)
+SYNTH_PLAYER = "SynthPlayer"
+SYNTH_SEED = 12345
+SYNTH_VERSION = 2
+GAMES_PER_MONTH = 300
+START_YEAR = 2015
+OPPONENTS = 400
+LINK_BASE = 10000000
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000}
+OPENINGS_URL = "https://www.chess.com/openings/"
+TIME_CONTROLS = [("60", 600, 0), ("180", 1800, 0), ("180+2", 1800, 20),
+                 ("300", 3000, 0), ("600", 6000, 0)]
+WIN_TYPES = ["won by resignation", "won on time", "won by resignation",
+             "won - game abandoned"]
+DRAW_TYPES = ["repetition", "agreement", "insufficient material",
+              "timeout vs insufficient material", "50-move rule"]
+STALEMATE = "stalemate"
+VARIANTS = 1000
+PREFIX_PLIES = (2, 16)
+EXTRA_PLIES = (0, 80)
+WHOLE_GAMES = 0.2
+STALEMATES = 0.01
+# (moves, ECOUrl slug, ECO code, mating side or None)
+GAME_POOL = [
+    ("e4 e5 Bc4 Nc6 Qh5 Nf6 Qxf7#",
+     "Italian-Game-Scholars-Mate", "C23", "w"),
+    ("f3 e5 g4 Qh4#", "Barnes-Opening-Fools-Mate", "A00", "b"),
+    ("e4 e5 Nf3 d6 Bc4 Bg4 Nc3 g6 Nxe5 Bxd1 Bxf7+ Ke7 Nd5#",
+     "Philidor-Defense-Legal-Trap", "C41", "w"),
+    ("e4 c6 d4 d5 Nc3 dxe4 Nxe4 Nd7 Qe2 Ngf6 Nd6#",
+     "Caro-Kann-Defense-Karpov-Variation-Smothered-Mate", "B17", "w"),
+    ("e4 c5 Nf3 d6 d4 cxd4 Nxd4 Nf6 Nc3 a6 Be3 e5 Nb3 Be6 f3 Be7 Qd2 O-O "
+     "O-O-O Nbd7 g4 b5 g5 b4 Ne2 Ne8 f4 a5 f5 a4 Nbd4 exd4 Nxd4 b3 Kb1 "
+     "bxc2+ Nxc2 Bb3 axb3 axb3 Na3 Ra4",
+     "Sicilian-Defense-Najdorf-Variation-English-Attack", "B90", None),
+    ("d4 d5 c4 e6 Nc3 Nf6 Bg5 Be7 e3 O-O Nf3 Nbd7 Rc1 c6 Bd3 dxc4 Bxc4 "
+     "Nd5 Bxe7 Qxe7 O-O Nxc3 Rxc3 e5",
+     "Queens-Gambit-Declined-Orthodox-Defense-Main-Line", "D63", None),
+    ("e4 e6 d4 d5 Nc3 Bb4 e5 c5 a3 Bxc3+ bxc3 Ne7 Qg4 Qc7 Qxg7 Rg8 Qxh7 "
+     "cxd4 Ne2 Nbc6 f4 dxc3",
+     "French-Defense-Winawer-Variation-Poisoned-Pawn-Variation", "C18",
+     None),
+    ("e4 e5 Nf3 Nc6 d4 exd4 Nxd4 Nf6 Nxc6 bxc6 e5 Qe7 Qe2 Nd5 c4 Ba6",
+     "Scotch-Game-Mieses-Variation", "C45", None),
+    ("d4 d5 Bf4 Nf6 e3 c5 c3 Nc6 Nd2 e6 Ngf3 Bd6 Bg3 O-O Bd3 b6 Ne5 Bb7 "
+     "f4 Ne7 Qf3 Nf5 Bf2 Be7 g4 Nd6 g5 Nd7",
+     "Queens-Pawn-Opening-Accelerated-London-System", "D02", None),
+    ("e4 e5 Nf3 Nc6 Bb5 a6 Ba4 Nf6 O-O Be7 Re1 b5 Bb3 d6 c3 O-O h3 Nb8 "
+     "d4 Nbd7 c4 c6 cxb5 axb5 Nc3 Bb7 Bg5 b4 Nb1 h6 Bh4 c5 dxe5 Nxe4 "
+     "Bxe7 Qxe7 exd6 Qf6 Nbd2 Nxd6 Nc4 Nxc4 Bxc4 Nb6 Ne5 Rae8 Bxf7+ Rxf7 "
+     "Nxf7 Rxe1+ Qxe1 Kxf7 Qe3 Qg5 Qxg5 hxg5 b3 Ke6 a3 Kd6 axb4 cxb4 Ra5 "
+     "Nd5 f3 Bc8 Kf2 Bf5 Ra7 g6 Ra6+ Kc5 Ke1 Nf4 g3 Nxh3 Kd2 Kb5 Rd6 Kc5 "
+     "Ra6 Nf2 g4 Bd3 Re6",
+     "Ruy-Lopez-Opening-Morphy-Defense-Breyer-Variation", "C95", None),
+]
+STALEMATE_GAME = (
+    "e3 a5 Qh5 Ra6 Qxa5 h5 h4 Rah6 Qxc7 f6 Qxd7+ Kf7 Qxb7 Qd3 Qxb8 Qh7 "
+    "Qxc8 Kg6 Qe6", "Van-Kruijs-Opening-Loyd-Stalemate", "A00")
+
+
+def pawn_targets(board, from_sq):
+    """
+    Return the squares that the pawn on from_sq can move to or capture
+    on (en passant is not included).
+    """
+    sqs = board.squares
+    step = BOARD_DIM if board.white else -BOARD_DIM
+    forward = from_sq + step
+    targets = []
+    if not sqs[forward]:
+        targets.append(forward)
+        start_row = 1 if board.white else BOARD_DIM - 2
+        if from_sq // BOARD_DIM == start_row and not sqs[forward + step]:
+            targets.append(forward + step)
+    col = forward % BOARD_DIM
+    for dcol in (-1, 1):
+        if 0 <= col + dcol < BOARD_DIM and sqs[forward + dcol]:
+            targets.append(forward + dcol)
+    return targets
+
+
+def slider_targets(board, from_sq, kind):
+    """
+    Return the squares that a bishop, rook or queen (kind) on from_sq
+    can move to or capture on.
+    """
+    targets = []
+    for ltype, pieces in SLIDERS.items():
+        if kind not in pieces:
+            continue
+        for ray in RAYS[ltype][from_sq]:
+            for to_sq in ray:
+                targets.append(to_sq)
+                if board.squares[to_sq]:
+                    break
+    return targets
+
+
+def legal_moves(board):
+    """
+    Return the list of (from square, to square, promotion) moves that
+    the side to move can make.  Castling and en passant captures are
+    not generated, and pawns only promote to queens.
+    """
+    sqs = board.squares
+    moves = []
+    for from_sq in range(NSQUARES):
+        piece = sqs[from_sq]
+        if not piece or piece.isupper() != board.white:
+            continue
+        kind = piece.upper()
+        if kind == 'P':
+            targets = pawn_targets(board, from_sq)
+        elif kind == 'N':
+            targets = sorted(KNIGHT_TABLE[from_sq])
+        elif kind == 'K':
+            targets = sorted(KING_TABLE[from_sq] - {from_sq})
+        else:
+            targets = slider_targets(board, from_sq, kind)
+        for to_sq in targets:
+            if sqs[to_sq] and sqs[to_sq].isupper() == board.white:
+                continue
+            if board.in_check_after(from_sq, to_sq):
+                continue
+            promote = ''
+            if kind == 'P' and to_sq // BOARD_DIM in (0, BOARD_DIM - 1):
+                promote = own_piece('Q', board.white)
+            moves.append((from_sq, to_sq, promote))
+    return moves
+
+
+def move_san(board, from_sq, to_sq, promote):
+    """
+    Return the Standard Algebraic Notation of a move (made by the side
+    to move), without the check or mate suffix.
+    """
+    kind = board.squares[from_sq].upper()
+    capture = 'x' if board.squares[to_sq] else ''
+    if kind == 'P':
+        san = square_name(to_sq)
+        if capture:
+            san = FILES[from_sq % BOARD_DIM] + capture + san
+        return san + ('=' + promote.upper() if promote else '')
+    others = [sq for sq in board.piece_origins(kind, to_sq)
+              if sq != from_sq and not board.in_check_after(sq, to_sq)]
+    origin = ''
+    if others:
+        if all(sq % BOARD_DIM != from_sq % BOARD_DIM for sq in others):
+            origin = FILES[from_sq % BOARD_DIM]
+        elif all(sq // BOARD_DIM != from_sq // BOARD_DIM for sq in others):
+            origin = str(from_sq // BOARD_DIM + 1)
+        else:
+            origin = square_name(from_sq)
+    return kind + origin + capture + square_name(to_sq)
+
+
+def random_moves(rgen, board, plies):
+    """
+    Play up to plies random legal moves on board.
+
+    Returns: tuple of the list of moves played (in SAN) and how the game
+    ended: the side that gave checkmate ('w' or 'b'), STALEMATE, or None
+    if the side to move still has a move.
+    """
+    moves = []
+    choices = legal_moves(board)
+    for _ in range(plies):
+        from_sq, to_sq, promote = rgen.choice(choices)
+        san = move_san(board, from_sq, to_sq, promote)
+        board.make_move(from_sq, to_sq, promote)
+        in_check = board.attacked(board.kings[own_piece('K', board.white)],
+                                  not board.white)
+        choices = legal_moves(board)
+        if not choices:
+            if not in_check:
+                moves.append(san)
+                return moves, STALEMATE
+            moves.append(san + '#')
+            return moves, 'b' if board.white else 'w'
+        moves.append(san + ('+' if in_check else ''))
+    return moves, None
+
+
+def make_variant(rgen):
+    """
+    Return one game line: a tuple of its moves (a list of SAN moves), the
+    ECOUrl slug, the ECO code, the final FEN and how it ended (see
+    random_moves).
+
+    Most lines are the first PREFIX_PLIES moves of a pool game followed
+    by up to EXTRA_PLIES random moves.  A WHOLE_GAMES share of the lines
+    are pool games played to the end, and a STALEMATES share are
+    STALEMATE_GAME.
+    """
+    if rgen.random() < STALEMATES:
+        moves, slug, eco = STALEMATE_GAME
+        moves, ending, extra = moves.split(), STALEMATE, 0
+    else:
+        moves, slug, eco, ending = rgen.choice(GAME_POOL)
+        moves, extra = moves.split(), 0
+        plies = rgen.randint(*PREFIX_PLIES)
+        if rgen.random() >= WHOLE_GAMES and plies < len(moves):
+            moves, extra = moves[:plies], rgen.randint(*EXTRA_PLIES)
+            ending = None
+    board = Board()
+    for move in moves:
+        board.push_san(move)
+    if extra:
+        added, ending = random_moves(rgen, board, extra)
+        moves = moves + added
+    return moves, slug, eco, board.fen(), ending
+
+
+def clock_text(tenths):
+    """
+    Format a clock value (1/10 seconds) as a %clk annotation value
+    """
+    secs, frac = divmod(tenths, 10)
+    return "{}:{:02d}:{:02d}.{}".format(secs // 3600, secs // 60 % 60,
+                                        secs % 60, frac)
+
+
+def annotated_moves(rgen, moves, base, increment, result):
+    """
+    Return chess.com style move text (move numbers, %clk annotations and
+    the result) for a list of moves, and the time (1/10 seconds) that
+    the moves took.
+    """
+    clocks = [base, base]
+    parts = []
+    elapsed = 0
+    for ply, move in enumerate(moves):
+        side = ply % 2
+        spent = min(clocks[side] - 1, int(rgen.expovariate(1 / 40)))
+        clocks[side] = clocks[side] - spent + increment
+        elapsed += spent
+        dots = "..." if side else "."
+        parts.append("{}{} {} {{[%clk {}]}}".format(
+            ply // 2 + 1, dots, move, clock_text(clocks[side])))
+    parts.append(result)
+    return " ".join(parts), elapsed
+
+
+def game_outcome(rgen, ending, white, black):
+    """
+    Pick the Result and Termination tags of a game, worded the way
+    chess.com words them.  Games whose moves end in checkmate are won by
+    the side that mated, and games that end in stalemate are drawn.
+    """
+    if ending == STALEMATE:
+        return "1/2-1/2", "Game drawn by stalemate"
+    if ending is not None:
+        winner = white if ending == "w" else black
+        return ("1-0" if ending == "w" else "0-1",
+                "{} won by checkmate".format(winner))
+    roll = rgen.random()
+    if roll < 0.15:
+        return "1/2-1/2", "Game drawn by {}".format(rgen.choice(DRAW_TYPES))
+    if roll < 0.575:
+        return "1-0", "{} {}".format(white, rgen.choice(WIN_TYPES))
+    return "0-1", "{} {}".format(black, rgen.choice(WIN_TYPES))
+
+
+def synthetic_game(rgen, number, when, player, variants):
+    """
+    Return one game in chess.com archive form.
+
+    Args:
+        rgen -- random.Random used for every choice
+        number -- index of the game in the career (used for its link)
+        when -- datetime that the game ended
+        player -- name of the player whose career this is
+        variants -- list of values returned by make_variant
+    """
+    opponent = "Opponent{:03d}".format(rgen.randrange(OPPONENTS))
+    white, black = player, opponent
+    if rgen.random() < 0.5:
+        white, black = black, white
+    moves, slug, eco, fen, ending = rgen.choice(variants)
+    result, termination = game_outcome(rgen, ending, white, black)
+    tcontrol, base, increment = rgen.choice(TIME_CONTROLS)
+    movetext, elapsed = annotated_moves(rgen, moves, base, increment,
+                                        result)
+    started = when - datetime.timedelta(seconds=max(1, elapsed // 10))
+    link = "https://www.chess.com/game/live/{}".format(LINK_BASE + number)
+    ratings = [rgen.randint(800, 1800), rgen.randint(800, 1800)]
+    headers = [
+        ("Event", "Live Chess"),
+        ("Site", "Chess.com"),
+        ("Date", started.strftime("%Y.%m.%d")),
+        ("Round", "-"),
+        ("White", white),
+        ("Black", black),
+        ("Result", result),
+        ("CurrentPosition", fen),
+        ("Timezone", "UTC"),
+        ("ECO", eco),
+        ("ECOUrl", OPENINGS_URL + slug),
+        ("UTCDate", started.strftime("%Y.%m.%d")),
+        ("UTCTime", started.strftime("%H:%M:%S")),
+        ("WhiteElo", str(ratings[0])),
+        ("BlackElo", str(ratings[1])),
+        ("TimeControl", tcontrol),
+        ("Termination", termination),
+        ("StartTime", started.strftime("%H:%M:%S")),
+        ("EndDate", when.strftime("%Y.%m.%d")),
+        ("EndTime", when.strftime("%H:%M:%S")),
+        ("Link", link)
+    ]
+    pgn = "\n".join('[{} "{}"]'.format(tag, value) for tag, value in headers)
+    pgn += "\n\n" + movetext + "\n"
+    return {
+        "url": link,
+        "pgn": pgn,
+        "time_control": tcontrol,
+        "end_time": int(when.timestamp()),
+        "rated": True,
+        "fen": fen,
+        "time_class": "blitz",
+        "rules": "chess",
+        "white": {"rating": ratings[0], "username": white},
+        "black": {"rating": ratings[1], "username": black}
+    }
+
+
+def month_start(month_numb):
+    """
+    Return the datetime at the start of the month_numb'th month after
+    January of START_YEAR.
+    """
+    year, month = divmod(month_numb, 12)
+    return datetime.datetime(START_YEAR + year, month + 1, 1)
+
+
+def write_career(directory, ngames, player=SYNTH_PLAYER, seed=SYNTH_SEED,
+                 per_month=GAMES_PER_MONTH):
+    """
+    Write the monthly files of a synthetic career.  The games are drawn
+    from up to VARIANTS different game lines.
+
+    Args:
+        directory -- directory the yYYYYmMM.json files are written to
+        ngames -- total number of games
+        player -- name of the player whose career this is (the user
+                  setting in chess.ini)
+        seed -- random number seed
+        per_month -- number of games in each monthly file
+
+    Returns: list of the paths of the files written
+    """
+    os.makedirs(directory, exist_ok=True)
+    rgen = random.Random(seed)
+    variants = [make_variant(rgen) for _ in range(min(ngames, VARIANTS))]
+    spacing = 27 * 24 * 3600 // per_month
+    written = []
+    for month_numb in range((ngames + per_month - 1) // per_month):
+        start = month_start(month_numb)
+        games = []
+        first = month_numb * per_month
+        for number in range(first, min(ngames, first + per_month)):
+            when = start + datetime.timedelta(
+                seconds=(number - first) * spacing +
+                rgen.randrange(max(1, spacing // 2)))
+            games.append(synthetic_game(rgen, number, when, player,
+                                        variants))
+        jfile = os.path.join(directory, "y{}m{:02d}{}".format(
+            start.year, start.month, JSON))
+        with open(jfile + ".tmp", 'w') as jfile_fd:
+            json.dump({"games": games}, jfile_fd)
+        os.replace(jfile + ".tmp", jfile)
+        written.append(jfile)
+    return written
+
+
+if __name__ == "__main__":
+    COUNT = sys.argv[2] if len(sys.argv) > 2 else "1k"
+    write_career(sys.argv[1], SCALES.get(COUNT) or int(COUNT))
@@ -1,18 +1,34 @@
 """
 Produce a report of how running out of time adversely affects
 the number of games won.
+
+Run with:
+    python -m chess_career.time_issues
+or, for the report over a range of "short on time" thresholds:
+    python -m chess_career.time_issues --sweep [threshold ...] [--scaled]
 """
+import argparse
+from bisect import bisect_right
+from chess_career.clocks import time_control
 from chess_career.extract_game import (
     extract_data,
+    window_games,
     O_ALL_DATA,
-    O_DRAW_TYPES,
-    O_PLAYER
+    O_DRAW_TYPES
 )
 from chess_career.io_module import generate_table_report
-from chess_career.utilities import get_times, material
-from chess_career.extract_game import USERNAME, TERMINATION
-from chess_career.io_module import WHITE
-from chess_career.utilities import CURRENT_POSITION
+from chess_career.profiling import timed
+from chess_career.columns import (
+    get_columns,
+    player_clocks,
+    player_material,
+    C_COLOR,
+    C_RESULT,
+    C_TERM,
+    C_TERM_NAMES,
+    C_TOMOVE,
+    RES_WIN
+)
 FRAC_FORMAT = "{:.5f}"
 LOT_WMA = "Lost on time with material advantage"
 LOT_WME = "Lost on time with material equal"
@@ -23,43 +39,58 @@ REPETITION = "Game drawn by repetition"
 STALEMATE = "Game drawn by stalemate"
 INSUF_VS_TO = "Game drawn by timeout vs insufficient material"
 ON_TIME = "on time"
+SHORT_TIME = 200
+ISSUES = [LOT_WMA, LOT_WME, REP_WMA, STM_WMA, OOT_OIM]
+SWEEP_SECONDS = [5, 10, 20, 30, 60, 120]
+SWEEP_FRACTIONS = [0.02, 0.05, 0.1, 0.2, 0.3]
 
 
-def get_lead_draws(data, d_type):
+def get_lead_draws(data, d_type, games=None, threshold=SHORT_TIME):
     """
     Find draws where we were leading but short on time.
 
     Input:
         data -- data from extract_game
         d_type -- type of draw (repetition or stalemate)
+        games -- only look at these game numbers (see
+                 extract_game.window_games).  All games if not set.
+        threshold -- clock value (1/10 seconds) at or below which we
+                     are short on time
 
     Returns a list of draws where we forced the draw, we
     are short of time, and we have a material advantage.
     """
+    clocks = player_clocks(get_columns(data))
+    return [gnumb for gnumb in lead_draw_candidates(data, d_type, games)
+            if clocks[gnumb] <= threshold]
+
+
+def lead_draw_candidates(data, d_type, games=None):
+    """
+    Find draws where we forced the draw with a material advantage and
+    our final clock is known.  get_lead_draws picks the ones of these
+    where we were short on time.
+    """
+    cols = get_columns(data)
+    clocks = player_clocks(cols)
+    points = player_material(cols)
+    if games is None:
+        games = window_games(data)
     retval = []
-    for gnumb in data[O_DRAW_TYPES][d_type]:
-        game_info = data[O_ALL_DATA][gnumb]
-        pindex = 1
-        if game_info[WHITE][USERNAME] == data[O_PLAYER]:
-            pindex = 0
-        timevec = get_times(game_info)
-        if not timevec:
+    for gnumb in data[O_DRAW_TYPES].get(d_type, []):
+        if gnumb not in games:
             continue
-        if timevec[pindex] > 200:
+        if clocks[gnumb] < 0:
             continue
-        tomove = game_info[CURRENT_POSITION].split(" ")[1]
-        if "wb".find(tomove) + pindex != 1:
+        if cols[C_TOMOVE][gnumb] + cols[C_COLOR][gnumb] != 1:
             continue
-        pdiff = material(game_info)
-        if pindex == 1:
-            pdiff = 0 - pdiff
-        if pdiff <= 0:
+        if points[gnumb] <= 0:
             continue
         retval.append(gnumb)
     return retval
 
 
-def handle_to_vs_insuf(data):
+def handle_to_vs_insuf(data, games=None):
     """
     Handle case where we time out but opponent had insufficient
     material to win.  Since it was not already drawn, assume
@@ -67,78 +98,172 @@ def handle_to_vs_insuf(data):
 
     Args:
         data  -- extract_game data
+        games -- only look at these game numbers (see
+                 extract_game.window_games).  All games if not set.
 
     Returns: list of games where we have material advantage against
     an opponent with too little material to win, but we drew because
     we ran out of time.
     """
+    cols = get_columns(data)
+    if games is None:
+        games = window_games(data)
     retval = []
-    for gnumb in data[O_DRAW_TYPES][INSUF_VS_TO]:
-        game_info = data[O_ALL_DATA][gnumb]
-        pindex = 1
-        if game_info[WHITE][USERNAME] == data[O_PLAYER]:
-            pindex = 0
-        tomove = game_info[CURRENT_POSITION].split(" ")[1]
-        if "wb".find(tomove) != pindex:
+    for gnumb in data[O_DRAW_TYPES].get(INSUF_VS_TO, []):
+        if gnumb not in games:
+            continue
+        if cols[C_TOMOVE][gnumb] != cols[C_COLOR][gnumb]:
             continue
         retval.append(gnumb)
     return retval
 
 
-def get_time_issues():
+@timed("get_time_issues")
+def get_time_issues(window=None, data=None):
     """
     Get time issues.
 
+    Args:
+        window -- only look at games inside this time window (see
+                  extract_game.window_games).  All games if not set.
+        data -- value returned by extract_data.  extract_data is called
+                if not set.
+
     Return a dict indexed by time issue.  Each entry is a list of game
-    numbers featuring this issue.
-    """
-    ret_dict = {
-        LOT_WMA: [],
-        LOT_WME: [],
-        REP_WMA: [],
-        STM_WMA: [],
-        OOT_OIM: [],
+    numbers featuring this issue.  Also returns the number of games
+    looked at.
+    """
+    if data is None:
+        data = extract_data()
+    games = window_games(data, window)
+    return find_time_issues(data, games), len(games)
+
+
+def find_time_issues(data, games):
+    """
+    Return the dict of time issues returned by get_time_issues, for the
+    games in games (see extract_game.window_games).
+    """
+    ret_dict = {issue: [] for issue in ISSUES}
+    cols = get_columns(data)
+    on_time = [code for code, term in enumerate(cols[C_TERM_NAMES])
+               if term.find(ON_TIME) > 0]
+    results = cols[C_RESULT]
+    terms = cols[C_TERM]
+    points = player_material(cols)
+    for count in games:
+        if results[count] != RES_WIN and terms[count] in on_time:
+            if points[count] > 0:
+                ret_dict[LOT_WMA].append(count)
+            if points[count] == 0:
+                ret_dict[LOT_WME].append(count)
+    ret_dict[REP_WMA] = get_lead_draws(data, REPETITION, games)
+    ret_dict[STM_WMA] = get_lead_draws(data, STALEMATE, games)
+    ret_dict[OOT_OIM] = handle_to_vs_insuf(data, games)
+    return ret_dict
+
+
+def short_time_values(data, d_type, games, scaled):
+    """
+    Return the sorted list of my final clocks in the lead_draw_candidates
+    games, in 1/10 seconds, or as a fraction of the base time of the
+    game's TimeControl if scaled is set.  Games without a known base
+    time are left out when scaled is set.
+    """
+    clocks = player_clocks(get_columns(data))
+    values = []
+    for gnumb in lead_draw_candidates(data, d_type, games):
+        if not scaled:
+            values.append(clocks[gnumb])
+            continue
+        base = time_control(data[O_ALL_DATA][gnumb])[0]
+        if base:
+            values.append(clocks[gnumb] / base)
+    values.sort()
+    return values
+
+
+def sweep_time_issues(thresholds, scaled=False, window=None, data=None):
+    """
+    Count the time issues for a whole range of "short on time"
+    thresholds.  The final clocks, material and side to move are
+    extracted once, and the games below every threshold are counted
+    with a binary search of the sorted clock values.
+
+    Args:
+        thresholds -- list of thresholds, in seconds, or as fractions of
+                      each game's base time if scaled is set
+        scaled -- if set, thresholds are fractions of the base time in
+                  the TimeControl tag (0.1 is 10 percent)
+        window -- only look at games inside this time window (see
+                  extract_game.window_games).  All games if not set.
+        data -- value returned by extract_data.  extract_data is called
+                if not set.
+
+    Returns: list (one entry per threshold) of dicts indexed by time
+    issue of the number of games featuring this issue, and the number
+    of games looked at.  Only REP_WMA and STM_WMA depend on the
+    threshold.
+    """
+    if data is None:
+        data = extract_data()
+    games = window_games(data, window)
+    fixed = find_time_issues(data, games)
+    values = {
+        REP_WMA: short_time_values(data, REPETITION, games, scaled),
+        STM_WMA: short_time_values(data, STALEMATE, games, scaled)
     }
-    data = extract_data()
-    for count, thisg in enumerate(data[O_ALL_DATA]):
-        if not thisg[TERMINATION].startswith(data[O_PLAYER]):
-            if thisg[TERMINATION].find(ON_TIME) > 0:
-                points = material(thisg)
-                if thisg[WHITE][USERNAME] != data[O_PLAYER]:
-                    points = 0 - points
-                if points > 0:
-                    ret_dict[LOT_WMA].append(count)
-                if points == 0:
-                    ret_dict[LOT_WME].append(count)
-    ret_dict[REP_WMA] = get_lead_draws(data, REPETITION)
-    ret_dict[STM_WMA] = get_lead_draws(data, STALEMATE)
-    ret_dict[OOT_OIM] = handle_to_vs_insuf(data)
-    return ret_dict, len(data[O_ALL_DATA])
-
-
-def generate_time_issue_report():
+    sweep = []
+    for threshold in thresholds:
+        limit = threshold if scaled else threshold * 10
+        counts = {issue: len(fixed[issue]) for issue in ISSUES}
+        for issue, issue_values in values.items():
+            counts[issue] = bisect_right(issue_values, limit)
+        sweep.append(counts)
+    return sweep, len(games)
+
+
+def possible_wins(counts):
+    """
+    Return the number of additional wins possible given the number of
+    games featuring each time issue.  Games lost on time with material
+    advantage count as wins, and the other issues as half wins.
+    """
+    extra_wins = 0
+    for row in ISSUES:
+        numb = counts[row]
+        if row != LOT_WMA:
+            numb /= 2
+        extra_wins += numb
+    return extra_wins
+
+
+def generate_time_issue_report(window=None, data=None):
     """
     User interface to generate report of games with time issues.
 
+    Input:
+        window -- only report on games inside this time window (see
+                  extract_game.window_games).  All games if not set.
+        data -- value returned by extract_data.  extract_data is called
+                if not set.
+
     Result:
         In reports sub-directory, a time_issues_report.html file
         will be generated
     """
-    info = get_time_issues()
+    info = get_time_issues(window, data)
     ginfo = info[0]
-    gcount = info[1]
+    gcount = max(info[1], 1)
     out_table = []
-    extra_wins = 0
-    for row in [LOT_WMA, LOT_WME, REP_WMA, STM_WMA, OOT_OIM]:
+    for row in ISSUES:
         out_line = []
         out_line.append(row)
         numb = len(ginfo[row])
         out_line.append("{}".format(numb))
         out_line.append(FRAC_FORMAT.format(numb / gcount))
-        if row != LOT_WMA:
-            numb /= 2
-        extra_wins += numb
         out_table.append(out_line)
+    extra_wins = possible_wins({row: len(ginfo[row]) for row in ISSUES})
     total = ['Additional Wins Possible']
     total.append("{}".format(extra_wins))
     total.append(FRAC_FORMAT.format(extra_wins / gcount))
@@ -147,5 +272,72 @@ def generate_time_issue_report():
     generate_table_report("time_issues_report", out_table)
 
 
+def generate_time_sweep_report(thresholds=None, scaled=False, window=None,
+                               data=None):
+    """
+    User interface to generate a report of how the time issues change
+    with the threshold for being short on time.  The report has the
+    rows of the time issue report (the number of games featuring each
+    time issue and the additional wins possible, as a number and a
+    fraction of all games) for every threshold, so it uses the
+    time_issues_report template.
+
+    Input:
+        thresholds -- list of thresholds (see sweep_time_issues).
+                      SWEEP_SECONDS, or SWEEP_FRACTIONS if scaled is
+                      set, if not given.
+        scaled -- thresholds are fractions of each game's base time
+        window -- only report on games inside this time window (see
+                  extract_game.window_games).  All games if not set.
+        data -- value returned by extract_data.  extract_data is called
+                if not set.
+
+    Result:
+        In reports sub-directory, a time_sweep_report.html file
+        will be generated
+    """
+    if thresholds is None:
+        thresholds = SWEEP_FRACTIONS if scaled else SWEEP_SECONDS
+    sweep, gcount = sweep_time_issues(thresholds, scaled, window, data)
+    gcount = max(gcount, 1)
+    out_table = []
+    for threshold, counts in zip(thresholds, sweep):
+        if scaled:
+            limit = "{:g}% of base time".format(threshold * 100)
+        else:
+            limit = "{:g} seconds".format(threshold)
+        for row in ISSUES:
+            out_table.append(["{} ({})".format(row, limit),
+                              "{}".format(counts[row]),
+                              FRAC_FORMAT.format(counts[row] / gcount)])
+        extra_wins = possible_wins(counts)
+        out_table.append(["Additional Wins Possible ({})".format(limit),
+                          "{}".format(extra_wins),
+                          FRAC_FORMAT.format(extra_wins / gcount)])
+    print(out_table)
+    generate_table_report("time_issues_report", out_table,
+                          report="time_sweep_report")
+
+
+def main():
+    """
+    Generate the time issue report, or the time sweep report if --sweep
+    is given.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sweep", metavar="THRESHOLD", type=float,
+                        nargs="*", help="generate the time sweep report "
+                        "for these thresholds (SWEEP_SECONDS or "
+                        "SWEEP_FRACTIONS if none are given)")
+    parser.add_argument("--scaled", action="store_true",
+                        help="sweep thresholds are fractions of the base "
+                        "time")
+    args = parser.parse_args()
+    if args.sweep is None:
+        generate_time_issue_report()
+        return
+    generate_time_sweep_report(args.sweep or None, args.scaled)
+
+
 if __name__ == "__main__":
-    generate_time_issue_report()
+    main()
@@ -1,12 +1,15 @@
 """
 Utility functions
 """
+import re
 CURRENT_POSITION = "CurrentPosition"
+ECOURL = "ECOUrl"
 DRAWN = " drawn "
 GAMEREC = "gamerec"
 CLOCKV = "%clk"
 PNAMES = "pnbrq"
 POINTS = [1, 3, 3, 5, 9]
+CLOCK_PATTERN = re.compile(r'\[%clk (\d+):(\d+):(\d+)(?:\.(\d+))?\]')
 
 
 def comp_time(movep):
@@ -33,6 +36,25 @@ def comp_time(movep):
     return ptime
 
 
+def clock_list(gamerec):
+    """
+    Extract all clock values from a game record in one pass.
+
+    Args:
+        gamerec -- move text of a game
+
+    Returns: list of the time left (in 1/10 second units) after each
+    ply that has a %clk annotation, in the order played.
+    """
+    values = []
+    for hours, mins, secs, frac in CLOCK_PATTERN.findall(gamerec):
+        ptime = ((int(hours) * 60 + int(mins)) * 60 + int(secs)) * 10
+        if frac:
+            ptime += int(frac)
+        values.append(ptime)
+    return values
+
+
 def get_times(game):
     """
     Return times of both players
@@ -42,20 +64,15 @@ def get_times(game):
 
     Returns: list of two time values (in 1/10 units)
     """
-    if CLOCKV in game[GAMEREC]:
-        parts = game[GAMEREC].split(' ')
-        moves = [x for x in parts if CLOCKV in x]
-        times = [x for x in parts if ":" in x]
-        if len(moves) == 1:
-            secv = [times[-1]]
-            secv.append(0)
-            return secv
-        time1, time2 = times[-2:]
-        secv = [comp_time(time1), comp_time(time2)]
-        if len(moves) % 2 == 1:
-            secv = [secv[1], secv[0]]
-        return secv
-    return []
+    values = clock_list(game[GAMEREC])
+    if not values:
+        return []
+    if len(values) == 1:
+        return [values[0], 0]
+    secv = values[-2:]
+    if len(values) % 2 == 1:
+        secv = [secv[1], secv[0]]
+    return secv
 
 
 def material(game):